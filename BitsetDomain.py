@@ -0,0 +1,86 @@
+# Author: Annabel Revers
+# Date:   October 2021
+
+class BitsetDomain:
+
+    # bit i of bits is set when values[i] is still in the domain
+        # values and index are shared by every domain built over the same universe
+    __slots__ = ("values", "index", "bits")
+
+    def __init__(self, values, index, bits):
+        self.values = values  # list of all possible values, position is the bit index
+        self.index = index  # dictionary mapping each value to its bit index
+        self.bits = bits  # integer bitmask of the values still remaining
+
+    # builds the value list and index dictionary shared by domains over the same values
+    @staticmethod
+    def make_universe(values):
+        index = {}
+        for value in values:
+            if value not in index:
+                index[value] = len(index)
+        return list(index), index
+
+    # builds a domain over a universe containing the given values
+    @staticmethod
+    def from_values(values, index, domain_values):
+        return BitsetDomain(values, index, BitsetDomain.mask_of(index, domain_values))
+
+    # integer bitmask with the bit of each given value set
+    @staticmethod
+    def mask_of(index, domain_values):
+        mask = 0
+        for value in domain_values:
+            mask |= 1 << index[value]
+        return mask
+
+    # popcount of the remaining values
+    def __len__(self):
+        return self.bits.bit_count()
+
+    def __bool__(self):
+        return self.bits != 0
+
+    def __contains__(self, value):
+        i = self.index.get(value)
+        return i is not None and (self.bits >> i) & 1 == 1
+
+    # yields remaining values in universe order
+    def __iter__(self):
+        bits = self.bits
+        values = self.values
+        # walk the mask a byte at a time so large domains iterate in linear time
+        data = bits.to_bytes((bits.bit_length() + 7) // 8, "little")
+        for byte_index, byte in enumerate(data):
+            base = byte_index * 8
+            while byte:
+                low = byte & -byte
+                yield values[base + low.bit_length() - 1]
+                byte ^= low
+
+    def __repr__(self):
+        return "BitsetDomain(" + repr(list(self)) + ")"
+
+    # new domain keeping only the values whose bits are set in mask (AND)
+    def keep_mask(self, mask):
+        return BitsetDomain(self.values, self.index, self.bits & mask)
+
+    # new domain without the values whose bits are set in mask (ANDNOT)
+    def remove_mask(self, mask):
+        return BitsetDomain(self.values, self.index, self.bits & ~mask)
+
+    # new domain without the given values
+    def without(self, domain_values):
+        return self.remove_mask(BitsetDomain.mask_of(self.index, domain_values))
+
+    # new domain with the given values added, adding any that are new to the shared universe
+    def with_values(self, domain_values):
+        for value in domain_values:
+            if value not in self.index:
+                self.index[value] = len(self.values)
+                self.values.append(value)
+        return BitsetDomain(self.values, self.index, self.bits | BitsetDomain.mask_of(self.index, domain_values))
+
+    # new domain containing just the given value
+    def only(self, value):
+        return self.keep_mask(1 << self.index[value])
@@ -1,21 +1,39 @@
 # Author: Annabel Revers
 # Date:   October 2021
 
+import bisect
+
 from ConstraintSatisfactionProblem import ConstraintSatisfactionProblem
+from PlacementDomain import PlacementDomain
 
 class CircuitBoardProblem(ConstraintSatisfactionProblem):
 
-    def __init__(self, pieces, width, height):
+    def __init__(self, pieces, width, height, bitset_on=False, symmetry_on=None):
         # human readable problem information
-        self.pieces = pieces  # list of tuples containing pieces' width and height
+        self.pieces = list(pieces)  # list of tuples containing pieces' width and height, copied since add_piece appends to it
         self.width = width  # board width
         self.height = height  # board height
+        # with bitset_on each piece's domain is a PlacementDomain bitmask instead of a list of points
+        self.bitset_on = bitset_on
         
         # used for printing result
         self.piece_to_char = self.make_piece_to_char() 
 
+        # identical pieces are interchangeable, so with symmetry_on each must be placed at a lower
+            # (x,y) origin than every identical piece after it, which skips every permutation of them
+            # left as None, this is only done while counting solutions, see count_solutions
+        self.symmetry_on = symmetry_on
+        self.twins = self.make_twins()  # set of the other pieces identical to each piece
+
+        # bitmask of each piece's rectangle placed at origin (0,0), bit y*width+x is point (x,y)
+        self.shape_masks = self.make_shape_masks()
+        # running bitmask of every point covered by the pieces in the tracked assignment
+        self.occupancy = 0
+        self.placed = None  # assignment the occupancy mask describes
+        self.placed_count = 0
+
         # pass variable, current domains, and constraints to supersclass
-        super().__init__(self.pieces_to_ints(), self.make_current_domains(), self.make_constraints())
+        super().__init__(self.pieces_to_ints(), self.make_current_domains(), self.make_constraints(), bitset_on)
     
     # convert pieces to integers
     def pieces_to_ints(self):
@@ -24,15 +42,26 @@ class CircuitBoardProblem(ConstraintSatisfactionProblem):
             variables.append(i)
         return variables
 
-    # generates a dictionary containing each piece's list of possible assignment values
+    # generates a dictionary containing each piece's possible assignment values
+        # each domain starts with just the origins where the piece fits on the board, (x,y) with
+        # x <= width-piece width and y <= height-piece height, and pieces of the same size share one domain
     def make_current_domains(self):
         current_domains = {}
-        # start each piece's domain as all possible points in circuit board
+        shared = {}  # piece width,height tuple -> domain of every piece with that size
         for i in range(len(self.pieces)):
-            current_domains[i] = [] 
-            for x in range(self.width):
-                for y in range(self.height):
-                    current_domains[i].append((x,y))    
+            piece = tuple(self.pieces[i])
+            if piece not in shared:
+                columns = self.width - piece[0] + 1
+                rows = self.height - piece[1] + 1
+                if self.bitset_on:
+                    shared[piece] = PlacementDomain.full(columns, rows)
+                else:
+                    options = []
+                    for x in range(columns):
+                        for y in range(rows):
+                            options.append((x,y))
+                    shared[piece] = options
+            current_domains[i] = shared[piece]
 
         return current_domains
 
@@ -47,39 +76,248 @@ class CircuitBoardProblem(ConstraintSatisfactionProblem):
         return constraints
 
     # generates dictionary mapping each piece variable to a specific character when printing result
+        # keyed by variable, so identical pieces still print as different characters
     def make_piece_to_char(self):
         piece_to_char = {}
         letter = 97
-        for piece in self.pieces:
-            piece_to_char[piece] = chr(letter)
+        for var in range(len(self.pieces)):
+            piece_to_char[var] = chr(letter)
             letter += 1
 
         return piece_to_char
+
+    # generates a list containing the set of other pieces identical to each piece, all empty with symmetry off
+    def make_twins(self):
+        twins = []
+        for i in range(len(self.pieces)):
+            twins.append(set())
+        if not self.symmetry_on:
+            return twins
+
+        # group pieces by width and height
+        groups = {}
+        for i in range(len(self.pieces)):
+            groups.setdefault(tuple(self.pieces[i]), []).append(i)
+        for group in groups.values():
+            for i in group:
+                twins[i].update(group)
+                twins[i].discard(i)
+        return twins
+
+    # adds a piece of the given width and height, constrained not to overlap any other piece, and returns its variable
+    def add_piece(self, piece):
+        var = len(self.pieces)
+        self.pieces.append(piece)
+        self.piece_to_char[var] = chr(97 + var)
+        self.shape_masks.append(self.shape_mask(piece))
+        self.twins.append(set())
+
+        # domain of the origins where the new piece fits
+        columns = self.width - piece[0] + 1
+        rows = self.height - piece[1] + 1
+        if self.bitset_on:
+            domain = PlacementDomain.full(columns, rows)
+        else:
+            domain = []
+            for x in range(columns):
+                for y in range(rows):
+                    domain.append((x,y))
+        self.add_variable(var, domain)
+
+        # pieces of the same size whose domains were not edited are interchangeable with it
+        if self.symmetry_on:
+            for other in self.variables:
+                if other != var and tuple(self.pieces[other]) == tuple(piece) and other not in self.edited_domains:
+                    self.twins[var].add(other)
+                    self.twins[other].add(var)
+        for other in self.variables:
+            if other != var:
+                self.add_constraint(var, other)
+        return var
+
+    # removes a piece, other pieces keep their variables
+    def remove_piece(self, var):
+        self.untwin(var)
+        self.remove_variable(var)
+
+    # a piece whose domain was edited is no longer interchangeable with the pieces of its size
+    def add_value(self, var, value):
+        self.untwin(var)
+        super().add_value(var, value)
+
+    def remove_value(self, var, value):
+        self.untwin(var)
+        super().remove_value(var, value)
+
+    # with symmetry_on left as None, identical pieces are only ordered while counting, where skipping their permutations
+        # pays off, e.g. 82428 instead of 15826176 layouts in 5.3s instead of 548s on packing_board(6, 4, 0.9, 2, seed=1)
+        # a first solution is found faster without the extra pruning to propagate, 0.09s instead of 0.17s on
+        # packing_board(20, 20, 0.6, seed=1), so the searches for one solution leave them unordered
+    def count_solutions(self, mrv_on, deg_on, lcv_on, ac3_on, limit=None):
+        if self.symmetry_on is not None:
+            return super().count_solutions(mrv_on, deg_on, lcv_on, ac3_on, limit)
+        self.order_twins(True)
+        try:
+            return super().count_solutions(mrv_on, deg_on, lcv_on, ac3_on, limit)
+        finally:
+            self.order_twins(None)
+
+    # counts in parallel the same way count_solutions does, ordering identical pieces when symmetry_on is None
+    def solve_parallel(self, mrv_on, deg_on, lcv_on, ac3_on, mode="first", workers=None, node_limit=10000, split_nodes=100):
+        options = (mrv_on, deg_on, lcv_on, ac3_on, mode, workers, node_limit, split_nodes)
+        if self.symmetry_on is not None or mode != "count":
+            return super().solve_parallel(*options)
+        self.order_twins(True)
+        try:
+            return super().solve_parallel(*options)
+        finally:
+            self.order_twins(None)
+
+    # sets symmetry_on and rebuilds the sets of identical pieces to match, leaving out removed and edited pieces
+    def order_twins(self, symmetry_on):
+        self.symmetry_on = symmetry_on
+        self.twins = self.make_twins()
+        variables = set(self.variables)
+        for var in range(len(self.pieces)):
+            if var not in variables or var in self.edited_domains:
+                self.untwin(var)
+        # supports remembered under the other ordering may no longer hold
+        self.residues = {}
+
+    # removes a piece from the sets of identical pieces
+    def untwin(self, var):
+        for other in self.twins[var]:
+            self.twins[other].discard(var)
+        self.twins[var] = set()
+
+    # checks that identical pieces var1 at x and var2 at y are placed in order of their variables
+    def in_symmetry_order(self, var1, var2, x, y):
+        if var1 < var2:
+            return x < y
+        return y < x
     
+    # pickles the problem without the running occupancy mask, which is rebuilt when needed
+    def __getstate__(self):
+        state = super().__getstate__()
+        state["occupancy"] = 0
+        state["placed"] = None
+        state["placed_count"] = 0
+        return state
+
+    # generates a list containing each piece's bitmask at origin (0,0)
+    def make_shape_masks(self):
+        shape_masks = []
+        for piece in self.pieces:
+            shape_masks.append(self.shape_mask(piece))
+        return shape_masks
+
+    # bitmask of a piece's rectangle at origin (0,0)
+    def shape_mask(self, piece):
+        # one row of the piece, repeated once per board row it covers
+        row = (1 << piece[0]) - 1
+        mask = 0
+        for y in range(piece[1]):
+            mask |= row << (y * self.width)
+        return mask
+
+    # checks if piece var placed at point value stays within the board
+    def fits(self, var, value):
+        piece = self.pieces[var]
+        return value[0] >= 0 and value[1] >= 0 and value[0]+piece[0] <= self.width and value[1]+piece[1] <= self.height
+
+    # bitmask of the points piece var covers when placed at point value, which must fit on the board
+    def placement_mask(self, var, value):
+        return self.shape_masks[var] << (value[1] * self.width + value[0])
+
+    # returns the occupancy mask of assignment
+        # the running mask is reused when it tracks this assignment, otherwise it is rebuilt
+        # assign and unassign keep it in step, so the tracked assignment must only be changed through them
+    def occupancy_of(self, assignment):
+        if assignment is not self.placed or len(assignment) != self.placed_count:
+            self.occupancy = 0
+            for var in assignment:
+                self.occupancy |= self.placement_mask(var, assignment[var])
+            self.placed = assignment
+            self.placed_count = len(assignment)
+        return self.occupancy
+
+    # adds piece placement to the assignment and to the running occupancy mask
+        # a piece already placed is moved, clearing the points of its old placement first
+    def assign(self, assignment, var, value):
+        occupancy = self.occupancy_of(assignment)
+        if var in assignment:
+            occupancy &= ~self.placement_mask(var, assignment[var])
+        else:
+            self.placed_count += 1
+        super().assign(assignment, var, value)
+        self.occupancy = occupancy | self.placement_mask(var, value)
+
+    # removes piece placement from the assignment and from the running occupancy mask
+    def unassign(self, assignment, var):
+        occupancy = self.occupancy_of(assignment)
+        self.occupancy = occupancy & ~self.placement_mask(var, assignment[var])
+        super().unassign(assignment, var)
+        self.placed_count -= 1
+
     # checks if value assignment for var would be consistent with current assignment
     def is_consistent(self, assignment, var, value):
         
-        points = []
-        piece = self.pieces[var]
-        for x in range(value[0], value[0]+piece[0]):
-            for y in range(value[1], value[1]+piece[1]):
-                points.append((x,y))
+        # check that the piece stays on the board
+        if not self.fits(var, value):
+            return False
 
-        # check that nothing overlaps
-        for var2 in assignment:
+        # check that identical pieces keep their order
+        for var2 in self.twins[var]:
+            if var2 in assignment and not self.in_symmetry_order(var, var2, value, assignment[var2]):
+                return False
 
-            mypoint = assignment[var2]
-            piece2 = self.pieces[var2]
-            for i in range(mypoint[0], mypoint[0]+piece2[0]):
-                for j in range(mypoint[1], mypoint[1]+piece2[1]):
-                    if (i, j) in points: 
-                        #print("returning False")
-                        return False
+        # check that nothing overlaps
+        return self.occupancy_of(assignment) & self.placement_mask(var, value) == 0
 
-        if value[0]+piece[0] > self.width or value[1]+piece[1] > self.height:
-            return False
+    # returns the placed pieces that piece var placed at point value would overlap
+        # a piece that does not fit on the board is not caused by any other piece
+    def find_conflicts(self, assignment, var, value):
+        culprits = set()
+        if not self.fits(var, value):
+            return culprits
 
-        return True
+        mask = self.placement_mask(var, value)
+        for var2 in assignment:
+            if self.fits(var2, assignment[var2]) and mask & self.placement_mask(var2, assignment[var2]):
+                culprits.add(var2)
+            elif var2 in self.twins[var] and not self.in_symmetry_order(var, var2, value, assignment[var2]):
+                culprits.add(var2)
+        return culprits
+
+    # returns a canonical (key, order) pair for SolveCache, the board size, sorted pieces, and any edited domains
+        # boards listing the same pieces in any order share a key, and order lists the pieces by size
+    def fingerprint(self):
+        order = sorted(self.variables, key=lambda var: (tuple(self.pieces[var]), var))
+        pieces = []
+        edited = []
+        for i in range(len(order)):
+            pieces.append(tuple(self.pieces[order[i]]))
+            if order[i] in self.edited_domains:
+                edited.append((i, tuple(sorted(self.current_domains[order[i]]))))
+        return ("CircuitBoardProblem", self.width, self.height, tuple(pieces), tuple(edited)), order
+
+    # builds an assignment from solution values listed in fingerprint order
+        # identical pieces are adjacent in that order, and their placements are sorted so they keep their order
+    def remap_solution(self, values, order):
+        values = list(values)
+        start = 0
+        for i in range(1, len(order) + 1):
+            if i == len(order) or tuple(self.pieces[order[i]]) != tuple(self.pieces[order[start]]):
+                # positions of the pieces in this run that are still identical to the others
+                positions = []
+                for j in range(start, i):
+                    if self.twins[order[j]]:
+                        positions.append(j)
+                placements = sorted(values[j] for j in positions)
+                for j in range(len(positions)):
+                    values[positions[j]] = placements[j]
+                start = i
+        return super().remap_solution(values, order)
 
     # gets the number of constraints a piece has on remaining unassigned variables
     def get_num_constraints(self, var):
@@ -89,29 +327,39 @@ class CircuitBoardProblem(ConstraintSatisfactionProblem):
 
     # least constraining value chooses the variable that rules out the least number of values
     def lcv_heuristic(self, assignment, var):
-        # make copy of domains for reordering
-        value_counts = []
+        # count, for every point on the board, how many other unassigned pieces could still be placed there
+        counts = []
+        for x in range(self.width):
+            counts.append([0] * self.height)
+        for v in self.variables:
+            if v not in assignment and not v == var:
+                for loc in self.current_domains[v]:
+                    if 0 <= loc[0] < self.width and 0 <= loc[1] < self.height:
+                        counts[loc[0]][loc[1]] += 1
+
+        # summed-area table of the counts, table[x][y] is the total over all points (i,j) with i < x and j < y
+        table = [[0] * (self.height+1)]
+        for x in range(self.width):
+            above = table[x]
+            column = [0]
+            column_sum = 0
+            for y in range(self.height):
+                column_sum += counts[x][y]
+                column.append(above[y+1] + column_sum)
+            table.append(column)
+
+        # get piece width,height tuple
+        piece = self.pieces[var]
 
-        # loop through variable's current domain optiosn
+        # score every consistent value by how many points it would eliminate from other pieces
+        value_counts = []
         for value in self.current_domains[var]:
-            # get list of points piece would cover should it be placed at this value
-            points_covered = []
-            # get piece width,height tuple from dictionary
-            piece = self.pieces[var]
-            for x in range(value[0], value[0] + piece[0]):
-                for y in range(value[1], value[1] + piece[1]):
-                    points_covered.append((x,y))
-
-            # loop through variable and see how many points this assignment would elimate from other piece
-            count = 0
-            for v in self.variables:
-                if v not in assignment and not v == var:
-                    for loc in points_covered:
-                        if loc in self.current_domains[v]:
-                            count += 1
-
             # append value and its count to array if consistent
             if self.is_consistent(assignment,var,value):
+                # the piece fits on the board, so its rectangle's total comes from four table corners
+                x1 = value[0] + piece[0]
+                y1 = value[1] + piece[1]
+                count = table[x1][y1] - table[value[0]][y1] - table[x1][value[1]] + table[value[0]][value[1]]
                 value_counts.append((value,count))
 
         # sort value/count pairs
@@ -124,28 +372,93 @@ class CircuitBoardProblem(ConstraintSatisfactionProblem):
 
         return domains
 
+    # pieces that are not twins only need their rectangles not to overlap, which depends on nothing but their sizes
+        # twins must also keep their order, so their arcs are compiled apart, knowing whether var1 comes first
+    def constraint_type(self, var1, var2):
+        if var2 in self.twins[var1]:
+            return ("rectangle-ordered", self.pieces[var1], self.pieces[var2], var1 < var2)
+        return ("rectangle", self.pieces[var1], self.pieces[var2])
+
+    # finds var1's origins that overlap every origin left for var2 without calling found_consistent
+    def find_unsupported(self, var1, var2, kind):
+        if kind[0] == "rectangle-ordered":
+            return self.find_unsupported_ordered(var1, var2, kind)
+        if kind[0] != "rectangle":
+            return super().find_unsupported(var1, var2, kind)
+        width1, height1 = kind[1]
+        width2, height2 = kind[2]
+        domain2 = self.current_domains[var2]
+
+        # var2 overlaps a placement of var1 only from the (width1+width2-1) x (height1+height2-1) origins around it,
+            # so with more origins left than that every placement of var1 has a support
+        if len(domain2) > (width1+width2-1) * (height1+height2-1):
+            return []
+
+        # otherwise var2 has few origins left, check each of var1's against them with the interval test inline
+        origins2 = list(domain2)
+        to_delete = []
+        for x in self.current_domains[var1]:
+            x0, x1 = x
+            for y0, y1 in origins2:
+                if x0+width1 <= y0 or y0+width2 <= x0 or x1+height1 <= y1 or y1+height2 <= x1:
+                    break
+            else:
+                to_delete.append(x)
+        return to_delete
+
+    # like find_unsupported for twins, whose supports must also come after x when var1 comes first, or before it otherwise
+        # var2's origins are sorted so the ones on the right side of x are a slice found by bisection,
+        # and the overlap window bound is applied to that slice instead of the whole domain
+    def find_unsupported_ordered(self, var1, var2, kind):
+        width1, height1 = kind[1]
+        width2, height2 = kind[2]
+        first = kind[3]
+        window = (width1+width2-1) * (height1+height2-1)
+        origins2 = sorted(self.current_domains[var2])   # domains are kept in origin order, so this is a linear pass
+
+        # origins of var1 before the window+1'th last origin of var2 (or after the window+1'th first one) have more
+            # origins on their side than can overlap them, so they are supported without bisecting
+        threshold = None
+        if len(origins2) > window:
+            threshold = origins2[len(origins2) - window - 1] if first else origins2[window]
+
+        to_delete = []
+        for x in self.current_domains[var1]:
+            if threshold is not None and (x < threshold if first else x > threshold):
+                continue
+            if first:
+                start = bisect.bisect_right(origins2, x)
+                later = len(origins2) - start
+                if later > window:
+                    continue
+                candidates = origins2[start:]
+            else:
+                end = bisect.bisect_left(origins2, x)
+                if end > window:
+                    continue
+                candidates = origins2[:end]
+
+            x0, x1 = x
+            for y0, y1 in candidates:
+                if x0+width1 <= y0 or y0+width2 <= x0 or x1+height1 <= y1 or y1+height2 <= x1:
+                    break
+            else:
+                to_delete.append(x)
+        return to_delete
+
     # helper for ac3's 'remove_inconsistent_values' function
         # checks if x and y would be consistent assignments with constraints on var1 and var2
     def found_consistent(self, var1, var2, x, y):
-        # get piece for var1
-        piece1 = self.pieces[var1]
-
-        # append all points that piece1 would occupy should it be assigned point y
-        points = []
-        for i in range(x[0], x[0]+piece1[0]):
-            for j in range(x[1], x[1]+piece1[1]):
-                points.append((i,j))
+        # identical pieces must also keep their order
+        if var2 in self.twins[var1] and not self.in_symmetry_order(var1, var2, x, y):
+            return False
 
-        # get piece for var2
+        piece1 = self.pieces[var1]
         piece2 = self.pieces[var2]
-        # loop through all points that piece2 would occupy should it be assigned point y 
-        for i in range(y[0], y[0]+piece2[0]):
-            for j in range(y[1], y[1]+piece2[1]):
-                # if it occupies a point that piece1 does, then there is a conflict/inconsistency
-                if (i, j) in points:
-                    return False
 
-        return True
+        # the rectangles only overlap if both their x intervals and their y intervals overlap
+        return (x[0]+piece1[0] <= y[0] or y[0]+piece2[0] <= x[0] or
+                x[1]+piece1[1] <= y[1] or y[1]+piece2[1] <= x[1])
 
     # prints final board assignment
     def print_board(self, assignment):
@@ -163,7 +476,7 @@ class CircuitBoardProblem(ConstraintSatisfactionProblem):
             piece = self.pieces[var]
             for x2 in range(assignment[var][0], assignment[var][0] + piece[0]):
                 for y2 in range(assignment[var][1], assignment[var][1] + piece[1]):
-                    board[self.height-y2-1][x2] = self.piece_to_char[piece]
+                    board[self.height-y2-1][x2] = self.piece_to_char[var]
         
         # print board
         for row in board:
@@ -209,3 +522,24 @@ if __name__ == "__main__":
     cb4 = CircuitBoardProblem([(3,2),(5,2),(2,3),(7,1)],10,3)
     cb4.print_board(cb4.backtracking_search(True, True, True, True))
     print("----------")
+
+    # TEST 5: test CircuitBoardProblem with identical pieces, which are only placed in one order
+    print("----------------------------------------------")
+    print("Testing CircuitBoardProblem with identical pieces...")
+    print("----------------------------------------------")
+    cb5 = CircuitBoardProblem([(2,2),(2,2),(2,2),(1,2),(1,2)],4,4)
+    cb5.print_board(cb5.backtracking_search(True, True, True, True))
+    print(cb5.count_solutions(True, True, True, True), "solutions, counting arrangements that only swap identical pieces once")
+    print("----------")
+
+    # TEST 6: test solving a board, then the same board with its pieces listed in reverse, through a SolveCache
+    print("----------------------------------------------")
+    print("Testing CircuitBoardProblem with a solve cache...")
+    print("----------------------------------------------")
+    from SolveCache import SolveCache
+    cache = SolveCache()
+    cache.solve(CircuitBoardProblem([(3,2),(5,2),(2,3),(7,1)],10,3))
+    cb6 = CircuitBoardProblem([(7,1),(2,3),(5,2),(3,2)],10,3)
+    cb6.print_board(cache.solve(cb6))
+    print(cache.hits, "hit,", cache.misses, "miss")
+    print("----------")
@@ -0,0 +1,199 @@
+# Author: Annabel Revers
+# Date:   October 2021
+
+import mmap
+import struct
+import sys
+from array import array
+
+# header of the binary format: magic, byte order, vertex count, arc count
+HEADER = struct.Struct("<4sc3xqq")
+MAGIC = b"CSPG"
+
+class CompactGraph:
+
+    # undirected graph stored in compressed sparse row (CSR) form, with every edge kept as two arcs
+        # the neighbors of vertex v are targets[offsets[v]:offsets[v+1]], and vertices are named by names[v]
+        # iterating over the graph yields every arc (u, v), so it can be used directly as a list of constraints
+    def __init__(self, names, offsets, targets, path=None):
+        self.names = names  # list of vertex names
+        self.offsets = offsets  # int64 array of length len(names)+1
+        self.targets = targets  # int32 array of arc targets
+        self.path = path  # binary file the arrays are memory-mapped from, if any
+
+    # number of arcs
+    def __len__(self):
+        return len(self.targets)
+
+    # yields every arc (u, v)
+    def __iter__(self):
+        offsets = self.offsets
+        targets = self.targets
+        for u in range(len(self.names)):
+            for i in range(offsets[u], offsets[u+1]):
+                yield (u, targets[i])
+
+    # returns the neighbors of a vertex as a slice of the targets array
+    def neighbors(self, v):
+        return self.targets[self.offsets[v]:self.offsets[v+1]]
+
+    # returns a view that maps each vertex to its neighbors, usable as a problem's neighbor index
+    def neighbor_view(self):
+        return NeighborView(self)
+
+    # builds a graph from undirected edges given as parallel arrays of endpoint indices
+        # counting sort places the arcs of each vertex together without sorting the edges, then repeated arcs are dropped
+        # raises ValueError for a self-loop, which no coloring could satisfy
+    @staticmethod
+    def from_edges(names, sources, destinations):
+        num_vertices = len(names)
+        offsets = array("q", bytes(8 * (num_vertices + 1)))
+        for u in sources:
+            offsets[u+1] += 1
+        for v in destinations:
+            offsets[v+1] += 1
+        for v in range(num_vertices):
+            offsets[v+1] += offsets[v]
+
+        # next free slot of each vertex's arcs
+        position = array("q", offsets)
+        targets = array("i", bytes(4 * offsets[num_vertices]))
+        for i in range(len(sources)):
+            u = sources[i]
+            v = destinations[i]
+            if u == v:
+                raise ValueError("self-loop on vertex " + str(names[u]) + ", a vertex cannot border itself")
+            targets[position[u]] = v
+            position[u] += 1
+            targets[position[v]] = u
+            position[v] += 1
+
+        # an edge listed more than once, or once in each direction, keeps just one pair of arcs,
+            # so repeats are dropped from each vertex's arcs, which are moved down over the gaps left
+        end = 0
+        for v in range(num_vertices):
+            row = array("i", dict.fromkeys(targets[offsets[v]:offsets[v+1]]))
+            offsets[v] = end
+            targets[end:end + len(row)] = row
+            end += len(row)
+        offsets[num_vertices] = end
+        del targets[end:]
+
+        return CompactGraph(names, offsets, targets)
+
+    # streams a DIMACS graph coloring (.col) file
+        # comment lines start with c, "p edge V E" gives the vertex count, and "e u v" is an edge between 1-based vertices
+    @staticmethod
+    def read_dimacs(path):
+        num_vertices = 0
+        sources = array("i")
+        destinations = array("i")
+        with open(path, "rb") as f:
+            for line in f:
+                if line.startswith(b"e"):
+                    fields = line.split()
+                    u = int(fields[1]) - 1
+                    v = int(fields[2]) - 1
+                    # a vertex bordering itself is not a constraint between two vertices, so self-loops are skipped
+                    if u == v:
+                        continue
+                    sources.append(u)
+                    destinations.append(v)
+                elif line.startswith(b"p"):
+                    num_vertices = int(line.split()[2])
+
+        names = []
+        for v in range(num_vertices):
+            names.append(str(v + 1))
+        return CompactGraph.from_edges(names, sources, destinations)
+
+    # streams a plain edge list file, one "name1 name2" edge per line, skipping blank lines and # comments
+        # names are numbered in the order they first appear
+    @staticmethod
+    def read_edge_list(path):
+        index = {}
+        names = []
+        sources = array("i")
+        destinations = array("i")
+        with open(path) as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) < 2 or fields[0].startswith("#"):
+                    continue
+                for name in fields[:2]:
+                    if name not in index:
+                        index[name] = len(names)
+                        names.append(name)
+                # self-loops are skipped like in read_dimacs, the name still becomes a vertex
+                if fields[0] == fields[1]:
+                    continue
+                sources.append(index[fields[0]])
+                destinations.append(index[fields[1]])
+        return CompactGraph.from_edges(names, sources, destinations)
+
+    # saves the graph in a binary format that load can memory-map
+    def save(self, path):
+        byteorder = b"<" if sys.byteorder == "little" else b">"
+        with open(path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, byteorder, len(self.names), len(self.targets)))
+            f.write(memoryview(self.offsets).cast("B"))
+            f.write(memoryview(self.targets).cast("B"))
+            f.write("\n".join(self.names).encode("utf-8"))
+
+    # loads a graph saved by save
+        # with mmap_on the arrays are views into the memory-mapped file instead of being read into memory
+    @staticmethod
+    def load(path, mmap_on=True):
+        with open(path, "rb") as f:
+            if mmap_on:
+                data = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+            else:
+                data = memoryview(f.read())
+
+        magic, byteorder, num_vertices, num_arcs = HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise ValueError(path + " is not a saved CompactGraph")
+        if byteorder != (b"<" if sys.byteorder == "little" else b">"):
+            raise ValueError(path + " was saved on a machine with a different byte order")
+
+        start = HEADER.size
+        offsets = data[start:start + 8 * (num_vertices + 1)].cast("q")
+        start += 8 * (num_vertices + 1)
+        targets = data[start:start + 4 * num_arcs].cast("i")
+        start += 4 * num_arcs
+        names = bytes(data[start:]).decode("utf-8").split("\n") if num_vertices else []
+
+        return CompactGraph(names, offsets, targets, path if mmap_on else None)
+
+    # pickles a memory-mapped graph as its path, to be mapped again, and any other graph as plain arrays
+    def __getstate__(self):
+        if self.path is not None:
+            return {"path": self.path}
+        return {"names": self.names, "offsets": array("q", self.offsets), "targets": array("i", self.targets)}
+
+    def __setstate__(self, state):
+        if "path" in state:
+            graph = CompactGraph.load(state["path"])
+            state = graph.__dict__
+        self.__dict__.update(state)
+        self.path = state.get("path")
+
+class NeighborView:
+
+    # maps each vertex of a CompactGraph to its neighbors, with the same indexing as a neighbor dictionary
+    __slots__ = ("graph", "offsets", "targets")
+
+    def __init__(self, graph):
+        self.graph = graph
+        self.offsets = graph.offsets
+        self.targets = graph.targets
+
+    def __getitem__(self, v):
+        return self.targets[self.offsets[v]:self.offsets[v+1]]
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    # pickles the view as its graph, which may hold memory-mapped arrays
+    def __reduce__(self):
+        return (NeighborView, (self.graph,))
@@ -1,21 +1,1040 @@
 # Author: Annabel Revers
 # Date:   October 2021
 
+import multiprocessing
+import random
 from collections import deque
-from copy import deepcopy
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from time import perf_counter
+from BitsetDomain import BitsetDomain
+from NogoodStore import NogoodStore
+
+# how many nodes a worker process expands between checks of the shared stop event
+WORKER_CHECK_INTERVAL = 256
+
+# state handed to each worker process by its pool initializer
+worker_stop_event = None    # event set once the workers' answers are no longer needed
+worker_problem = None   # problem that parallel subproblems are applied to
+
+# runs in each new worker process to receive the shared stop event and problem
+def init_worker(stop_event, problem=None):
+    global worker_stop_event, worker_problem
+    worker_stop_event = stop_event
+    worker_problem = problem
+
+# makes a should_stop function for a worker's search
+    # it stops after node_limit nodes, and checks the shared stop event every WORKER_CHECK_INTERVAL nodes
+def make_worker_should_stop(node_limit=None):
+    nodes = [0]
+    def should_stop():
+        nodes[0] += 1
+        if node_limit is not None and nodes[0] > node_limit:
+            return True
+        return nodes[0] % WORKER_CHECK_INTERVAL == 0 and worker_stop_event.is_set()
+    return should_stop
+
+# runs one portfolio configuration in a worker process
+    # returns the solution (or False) and whether the search was stopped before finishing
+def run_portfolio_config(problem, config, seed):
+    if seed is not None:    # break heuristic ties randomly
+        problem.rng = random.Random(seed)
+    problem.should_stop = make_worker_should_stop()
+
+    solution = problem.backtracking_search(*config)
+    return solution, problem.interrupted
+
+# solves one connected component of worker_problem in a worker process
+def run_component(component, options, mode):
+    worker_problem.should_stop = make_worker_should_stop()
+    return worker_problem.solve_component(component, options, mode)
+
+# searches one subproblem of a parallel search in a worker process
+    # a subproblem is (assignment, changed domains, variable, values left to try for that variable)
+    # returns the solutions found (just counted in count mode), their number, and the open subproblems
+    # left over if the search ran out of nodes
+def run_parallel_subproblem(subproblem, options, mode, node_limit):
+    problem = worker_problem
+    assigned, domains, var, values = subproblem
+    base_mark = len(problem.trail)
+
+    # put the problem into the subproblem's state
+    for v in domains:
+        problem.set_domain(v, domains[v])
+    assignment = {}
+    for v in assigned:
+        problem.assign(assignment, v, assigned[v])
+
+    problem.should_stop = make_worker_should_stop(node_limit)
+    solutions = []
+    count = 0
+    search = problem.iterative_backtracking(assignment, *options, root=(var, values), split_on_stop=True)
+    for solution in search:
+        count += 1
+        if mode != "count":
+            solutions.append(dict(solution))
+        if mode == "first":
+            break
+    search.close()
+
+    # open subproblems only list the domains changed inside this search, add the subproblem's own
+    open_subproblems = []
+    if problem.interrupted and not worker_stop_event.is_set():
+        for open_assigned, open_domains, open_var, open_values in problem.open_subproblems:
+            changed = dict(domains)
+            changed.update(open_domains)
+            open_subproblems.append((open_assigned, changed, open_var, open_values))
+
+    # restore the problem for the next subproblem
+    for v in list(assignment):
+        problem.unassign(assignment, v)
+    problem.undo_to(base_mark)
+    problem.should_stop = None
+
+    return solutions, count, open_subproblems
+
+# i-th term (from 1) of the luby sequence 1,1,2,1,1,2,4,1,1,2,1,1,2,4,8,... used to size restarts
+def luby(i):
+    k = 1
+    while (1 << k) - 1 < i:
+        k += 1
+    if (1 << k) - 1 == i:
+        return 1 << (k - 1)
+    return luby(i - (1 << (k - 1)) + 1)
 
 class ConstraintSatisfactionProblem:
 
-    def __init__(self, variables, current_domains, constraints):
+    def __init__(self, variables, current_domains, constraints, bitset_on=False):
         self.variables = variables
+        # optionally store each domain as an integer bitmask over value indices
+        self.bitset_on = bitset_on
+        if bitset_on:
+            current_domains = self.make_bitset_domains(current_domains)
         self.current_domains = current_domains
         self.constraints = constraints
+        # index of each variable's constrained neighbors, built once so lookups cost O(degree)
+        self.neighbors = self.make_neighbors()
+        # undo log of (variable, previous domain) pairs for restoring current_domains on backtrack
+        self.trail = []
+        # last support found for each value when revising an arc, keyed by arc then value
+        self.residues = {}
+        # random.Random used to break heuristic ties, None breaks them by variable order
+        self.rng = None
+        # optional function checked at every search step, the search stops when it returns True
+        self.should_stop = None
+        # whether the last search was stopped by should_stop rather than finishing
+        self.interrupted = False
+        # unexplored parts of the last search stopped with split_on_stop, as subproblems
+        self.open_subproblems = []
+        # optional SolverStats that searches record counters, timings and hook calls in, None records nothing
+        self.stats = None
+        # weight of each constraint, keyed by the frozenset of its two variables, raised every time it causes a failure
+            # missing constraints have weight 1, and weights are kept across searches and restarts
+        self.constraint_weights = {}
+        # whether variables are selected by the dom/wdeg heuristic instead of mrv_on and deg_on
+        self.wdeg_on = False
+        # variables added, or given smaller domains, since the last resolve, which must be searched again
+        self.changed_variables = set()
+        # variables whose domains were edited with add_value or remove_value since the problem was built
+        self.edited_domains = set()
+        # support bitmasks of compiled constraints, keyed by constraint_type then value, see find_unsupported
+        self.support_tables = {}
+
+    # pickles the problem without the state of a search in progress, so it is cheap to send to worker processes
+        # the copy starts from the current domains with an empty trail
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["trail"] = []
+        state["residues"] = {}
+        state["should_stop"] = None
+        state["open_subproblems"] = []
+        state["stats"] = None
+        return state
     
+    # builds a dictionary listing the neighbors of each variable
+        # var2 is listed under var1 once for every constraint (var1, var2), in constraint order
+    def make_neighbors(self):
+        neighbors = {}
+        for var in self.variables:
+            neighbors[var] = []
+        for constraint in self.constraints:
+            neighbors[constraint[0]].append(constraint[1])
+        return neighbors
+
     # backtracking search for constraint satisfaction problem
+        # returns the first solution found, or False if there is none
     def backtracking_search(self, mrv_on, deg_on, lcv_on, ac3_on):
-        return self.recursive_backtracking({}, mrv_on, deg_on, lcv_on, ac3_on)  # initial assignment is empty
+        solutions = self.iter_solutions(mrv_on, deg_on, lcv_on, ac3_on)
+        solution = next(solutions, False)
+        # stop the search, which restores current_domains
+        solutions.close()
+        return solution
+
+    # searches with dom/wdeg variable ordering and restarts, returning the first solution found or False
+        # each run stops after a budget of search steps: base_steps times the luby sequence (1,1,2,1,1,2,4,...)
+        # for cutoff="luby", or base_steps times growth to the power of the restart number for cutoff="geometric"
+        # ties are broken randomly, and constraint weights learned from failures carry over to the next run
+        # gives up (with interrupted set) after max_restarts restarts, or when should_stop asks it to
+    def restart_search(self, lcv_on, ac3_on, cutoff="luby", base_steps=100, growth=1.5, max_restarts=None, seed=None):
+        outer_should_stop = self.should_stop
+        outer_rng = self.rng
+        outer_wdeg_on = self.wdeg_on
+        if cutoff not in ("luby", "geometric"):
+            raise ValueError("unknown restart cutoff: " + str(cutoff))
+
+        self.rng = random.Random(seed)
+        self.wdeg_on = True
+        try:
+            restart = 0
+            while True:
+                if cutoff == "luby":
+                    limit = base_steps * luby(restart + 1)
+                else:
+                    limit = int(base_steps * growth ** restart)
+
+                steps = [0]
+                stopped_outside = [False]
+                # stops the run once it uses up its budget, or when the caller's should_stop says so
+                def should_stop():
+                    steps[0] += 1
+                    if outer_should_stop is not None and outer_should_stop():
+                        stopped_outside[0] = True
+                        return True
+                    return steps[0] > limit
+                self.should_stop = should_stop
+
+                solution = self.backtracking_search(False, False, lcv_on, ac3_on)
+                # a run that finished without being stopped has either found a solution or proved there is none
+                if solution or not self.interrupted or stopped_outside[0]:
+                    return solution
+
+                restart += 1
+                if max_restarts is not None and restart > max_restarts:
+                    return False
+        finally:
+            self.should_stop = outer_should_stop
+            self.rng = outer_rng
+            self.wdeg_on = outer_wdeg_on
+
+    # min-conflicts local search for problems too large to search exhaustively
+        # starts from a greedy assignment and repeatedly moves a random conflicted variable to the value with the
+        # fewest conflicts, where a conflict is a constraint whose values found_consistent rejects
+        # moving a variable back to a value it just left is tabu for tabu_tenure steps unless it beats the best
+        # assignment so far, and with probability walk_probability a random value is taken instead
+        # returns the best assignment found and its number of conflicting constraints (0 for a solution)
+        # expects each constraint to be listed in both directions, as in MapProblem and CircuitBoardProblem
+    def min_conflicts(self, max_steps=100000, seed=None, tabu_tenure=2, walk_probability=0.02):
+        rng = random.Random(seed)
+        assignment = {}
+        domains = {}
+        for var in self.variables:
+            domains[var] = list(self.current_domains[var])
+
+        # greedy start: give each variable the value with fewest conflicts with those already assigned
+        for var in self.variables:
+            best_value = None
+            best_count = float('inf')
+            for value in domains[var]:
+                count = self.count_conflicts(assignment, var, value)
+                if count < best_count:
+                    best_value = value
+                    best_count = count
+            if best_value is not None:
+                assignment[var] = best_value
+
+        # conflicts of each variable, and the variables with any, kept in a list with their positions for random picks
+        conflicts = {}
+        conflicted = []
+        position = {}
+        total = 0
+        for var in assignment:
+            conflicts[var] = self.count_conflicts(assignment, var, assignment[var])
+            total += conflicts[var]
+            if conflicts[var]:
+                position[var] = len(conflicted)
+                conflicted.append(var)
+
+        # moves since the best assignment so far, undone at the end to get back to it
+        best_total = total
+        moves = []
+        tabu_until = {}
+
+        for step in range(max_steps):
+            if not conflicted:
+                break
+            var = rng.choice(conflicted)
+            old_value = assignment[var]
+
+            # choose the value to move var to
+            if rng.random() < walk_probability:
+                new_value = rng.choice(domains[var])
+            else:
+                candidates = []
+                fewest = float('inf')
+                for value in domains[var]:
+                    if value == old_value:
+                        continue
+                    count = self.count_conflicts(assignment, var, value)
+                    # tabu values are allowed only if they would beat the best assignment so far
+                    if tabu_until.get((var, value), -1) > step and total - 2 * (conflicts[var] - count) >= best_total:
+                        continue
+                    if count < fewest:
+                        fewest = count
+                        candidates = [value]
+                    elif count == fewest:
+                        candidates.append(value)
+                if not candidates:
+                    continue
+                new_value = rng.choice(candidates)
+            if new_value == old_value:
+                continue
+
+            # move var and update its neighbors' conflicts, each constraint being counted from both ends
+            assignment[var] = new_value
+            tabu_until[(var, old_value)] = step + tabu_tenure
+            moves.append((var, old_value))
+            for neighbor in self.neighbors[var]:
+                if neighbor not in assignment:
+                    continue
+                before = not self.found_consistent(var, neighbor, old_value, assignment[neighbor])
+                after = not self.found_consistent(var, neighbor, new_value, assignment[neighbor])
+                if before != after:
+                    change = 1 if after else -1
+                    for changed in (var, neighbor):
+                        conflicts[changed] += change
+                        total += change
+                        self.update_conflicted(conflicted, position, changed, conflicts[changed])
+
+            if total < best_total:
+                best_total = total
+                moves = []
+
+        # go back to the best assignment seen
+        for var, value in reversed(moves):
+            assignment[var] = value
+
+        return assignment, best_total
+
+    # counts the assigned neighbors whose values found_consistent rejects with value for var
+    def count_conflicts(self, assignment, var, value):
+        count = 0
+        for neighbor in self.neighbors[var]:
+            if neighbor in assignment and not self.found_consistent(var, neighbor, value, assignment[neighbor]):
+                count += 1
+        return count
+
+    # adds var to or removes it from the list of conflicted variables for min_conflicts
+    def update_conflicted(self, conflicted, position, var, count):
+        if count and var not in position:
+            position[var] = len(conflicted)
+            conflicted.append(var)
+        elif not count and var in position:
+            # move the last variable into var's place
+            i = position.pop(var)
+            last = conflicted.pop()
+            if last != var:
+                conflicted[i] = last
+                position[last] = i
+
+    # races several heuristic configurations in a process pool and returns the first solution found
+        # configs is a list of (mrv_on, deg_on, lcv_on, ac3_on) tuples, all 16 combinations by default
+        # with a seed, each configuration also breaks mrv and degree ties randomly using its own seed
+        # by default every configuration gets its own worker process, so they all race at once
+    def solve_portfolio(self, configs=None, workers=None, seed=None):
+        if configs is None:
+            configs = []
+            for i in range(16):
+                configs.append((i & 8 != 0, i & 4 != 0, i & 2 != 0, i & 1 != 0))
+        if workers is None:
+            workers = len(configs)
+
+        stop_event = multiprocessing.Event()
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(stop_event,))
+        try:
+            pending = set()
+            for i in range(len(configs)):
+                config_seed = None if seed is None else seed + i
+                pending.add(executor.submit(run_portfolio_config, self, configs[i], config_seed))
+
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    solution, interrupted = future.result()
+                    # a finished search is the answer, whether it found a solution or proved there is none
+                    if not interrupted:
+                        return solution
+            return False
+        finally:
+            # tell running workers to stop and drop the configurations that have not started
+            stop_event.set()
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    # splits the search tree into subproblems and searches them in a process pool
+        # mode is "first" for the first solution found (or False), "all" for a list of every solution, or "count"
+        # the search is split after split_nodes nodes, and a subproblem that takes more than node_limit nodes
+        # is split again into the parts it has not explored yet, so large subtrees are shared out dynamically
+        # the caller's should_stop is checked as well, stopping the search with interrupted set
+    def solve_parallel(self, mrv_on, deg_on, lcv_on, ac3_on, mode="first", workers=None, node_limit=10000, split_nodes=100):
+        options = (mrv_on, deg_on, lcv_on, ac3_on)
+        solutions = []
+        count = 0
+
+        # search the top of the tree here, stopping after split_nodes nodes to hand out what is left
+        outer_should_stop = self.should_stop
+        nodes = [0]
+        stopped_outside = [False]
+        # stops the local search after split_nodes nodes, or when the caller's should_stop says so
+        def should_stop():
+            if outer_should_stop is not None and outer_should_stop():
+                stopped_outside[0] = True
+                return True
+            nodes[0] += 1
+            return nodes[0] > split_nodes
+        self.should_stop = should_stop
+        try:
+            search = self.iterative_backtracking({}, *options, split_on_stop=True)
+            for solution in search:
+                count += 1
+                if mode != "count":
+                    solutions.append(dict(solution))
+                if mode == "first":
+                    break
+            search.close()
+        finally:
+            self.should_stop = outer_should_stop
+
+        if mode == "first" and solutions:
+            self.interrupted = False
+            return solutions[0]
+        subproblems = []
+        if self.interrupted:
+            subproblems = self.open_subproblems
+            self.open_subproblems = []
+        # a search the caller stopped hands nothing out
+        if stopped_outside[0]:
+            subproblems = []
+
+        if subproblems:
+            stop_event = multiprocessing.Event()
+            executor = ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(stop_event, self))
+            try:
+                pending = set()
+                for subproblem in subproblems:
+                    pending.add(executor.submit(run_parallel_subproblem, subproblem, options, mode, node_limit))
+
+                while pending:
+                    # with a should_stop from the caller, wake up now and then to ask it
+                    done, pending = wait(pending, timeout=None if outer_should_stop is None else 0.1, return_when=FIRST_COMPLETED)
+                    if outer_should_stop is not None and outer_should_stop():
+                        stopped_outside[0] = True
+                        break
+                    for future in done:
+                        found, found_count, open_subproblems = future.result()
+                        if mode == "first" and found:
+                            self.interrupted = False
+                            return found[0]
+                        solutions.extend(found)
+                        count += found_count
+                        # the subproblem ran out of nodes, queue the parts it did not get to
+                        for subproblem in open_subproblems:
+                            pending.add(executor.submit(run_parallel_subproblem, subproblem, options, mode, node_limit))
+            finally:
+                # tell running workers to stop and drop the subproblems that have not started
+                stop_event.set()
+                executor.shutdown(wait=True, cancel_futures=True)
+
+        # stopped by the caller, the answer only covers the part of the tree searched
+        self.interrupted = stopped_outside[0]
+        if mode == "first":
+            return False
+        elif mode == "count":
+            return count
+        return solutions
+
+    # finds the connected components of the constraint graph, each a list of variables in variable order
+    def connected_components(self):
+        # union-find over the constraints
+        parent = {}
+        for var in self.variables:
+            parent[var] = var
+
+        # returns the representative of var's component, halving the path to it along the way
+        def find(var):
+            while parent[var] != var:
+                parent[var] = parent[parent[var]]
+                var = parent[var]
+            return var
+
+        for var1 in self.variables:
+            for var2 in self.neighbors[var1]:
+                root1 = find(var1)
+                root2 = find(var2)
+                if root1 != root2:
+                    parent[root2] = root1
+
+        components = {}
+        for var in self.variables:
+            components.setdefault(find(var), []).append(var)
+        return list(components.values())
+
+    # solves each connected component of the constraint graph on its own and merges the results
+        # mode "first" returns a complete solution or False, mode "count" returns the number of solutions
+        # any component with no solution makes the whole problem unsatisfiable, which is reported at once
+        # with workers given, components of at least parallel_size variables are solved in a process pool
+        # while the smaller ones are solved here
+    def solve_components(self, mrv_on, deg_on, lcv_on, ac3_on, mode="first", workers=None, parallel_size=1000):
+        options = (mrv_on, deg_on, lcv_on, ac3_on)
+        local = []
+        remote = []
+        for component in self.connected_components():
+            if workers and len(component) >= parallel_size:
+                remote.append(component)
+            else:
+                local.append(component)
+
+        # solution merged so far, or product of the component counts
+        result = {} if mode == "first" else 1
+        failure = False if mode == "first" else 0
+
+        executor = None
+        stop_event = multiprocessing.Event()
+        try:
+            # start the large components first so they run while the small ones are solved here
+            pending = set()
+            if remote:
+                executor = ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(stop_event, self))
+                for component in remote:
+                    pending.add(executor.submit(run_component, component, options, mode))
+
+            for component in local:
+                answer = self.solve_component(component, options, mode)
+                if not answer:
+                    return failure
+                result = self.merge_component(result, answer, mode)
+
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    answer = future.result()
+                    if not answer:
+                        return failure
+                    result = self.merge_component(result, answer, mode)
+            return self.merged_result(result, mode)
+        finally:
+            if executor is not None:
+                # tell running workers to stop and drop the components that have not started
+                stop_event.set()
+                executor.shutdown(wait=True, cancel_futures=True)
+
+    # searches just the variables of one component, see solve_components
+    def solve_component(self, component, options, mode):
+        all_variables = self.variables
+        self.variables = component
+        try:
+            if mode == "count":
+                return self.count_solutions(*options)
+            return self.backtracking_search(*options)
+        finally:
+            self.variables = all_variables
+
+    # combines one component's answer into the result of solve_components
+    def merge_component(self, result, answer, mode):
+        if mode == "count":
+            return result * answer
+        result.update(answer)
+        return result
+
+    # turns the merged result of solve_components into its answer, which it already is unless a subclass merges otherwise
+    def merged_result(self, result, mode):
+        return result
+
+    # solves the problem again after edits, starting from solution, a solution from before them or False
+        # the variables the edits changed are searched again while every other variable keeps its value, and each
+        # time that fails the neighbors of the searched variables are freed too, until the search succeeds
+        # every attempt but the last, which frees all variables, stops after attempt_nodes nodes, doubling each time
+        # returns the new solution, or False if the edited problem has none or should_stop stopped the search
+    def resolve(self, solution, mrv_on, deg_on, lcv_on, ac3_on, attempt_nodes=1000):
+        # with no earlier solution, e.g. False from a search that found none, every variable is searched
+        if not solution:
+            solution = {}
+        free = set(self.changed_variables)
+        for var in self.variables:
+            if var not in solution or solution[var] not in self.current_domains[var]:
+                free.add(var)
+        self.changed_variables = set()
+
+        while True:
+            last = len(free) >= len(self.variables)
+            answer, stopped = self.warm_search(solution, free, mrv_on, deg_on, lcv_on, ac3_on, None if last else attempt_nodes)
+            self.interrupted = stopped
+            if answer or last or stopped:
+                return answer
+
+            # free the variables next to the ones searched, or every variable once that frees nothing new
+            widened = set(free)
+            for var in free:
+                widened.update(self.neighbors[var])
+            if len(widened) == len(free):
+                widened = set(self.variables)
+            free = widened
+            attempt_nodes *= 2
+
+    # one attempt of resolve, searching the free variables with the others fixed to their values in solution
+        # old values that break a constraint with values already fixed are freed as well, and added to free
+        # returns the solution found or False, and whether should_stop rather than node_limit stopped the search
+    def warm_search(self, solution, free, mrv_on, deg_on, lcv_on, ac3_on, node_limit):
+        base_mark = len(self.trail)
+        assignment = {}
+        for var in self.variables:
+            if var in free:
+                continue
+            value = solution[var]
+            if self.count_conflicts(assignment, var, value):
+                free.add(var)
+                continue
+            self.assign(assignment, var, value)
+            self.assign_domain(var, value)
+
+        # count nodes against node_limit, passing on the caller's should_stop
+        should_stop = self.should_stop
+        nodes = [0]
+        stopped = [False]
+        def attempt_should_stop():
+            if should_stop is not None and should_stop():
+                stopped[0] = True
+                return True
+            nodes[0] += 1
+            return node_limit is not None and nodes[0] > node_limit
+        self.should_stop = attempt_should_stop
+
+        try:
+            answer = False
+            # the fixed values were consistent before the edits, so only the fixed variables next to free ones
+                # need propagating instead of running ac3 on the whole problem
+            consistent = True
+            if ac3_on:
+                boundary = set()
+                for var in free:
+                    for neighbor in self.neighbors[var]:
+                        if neighbor in assignment:
+                            boundary.add(neighbor)
+                for var in boundary:
+                    if not self.propagate(var):
+                        consistent = False
+                        break
+
+            if consistent and assignment and self.is_complete(assignment):
+                answer = dict(assignment)
+            elif consistent:
+                root = None
+                if assignment:
+                    # start from the first free variable, skipping the search's own ac3 of the whole problem
+                    var = self.select_unassigned_variable(assignment, mrv_on, deg_on)
+                    root = (var, self.order_domain_values(assignment, var, lcv_on))
+                search = self.iterative_backtracking(assignment, mrv_on, deg_on, lcv_on, ac3_on, root=root)
+                answer = next(search, False)
+                if answer:
+                    answer = dict(answer)
+                search.close()
+        finally:
+            self.should_stop = should_stop
+            # remove the fixed values again
+            for var in list(assignment):
+                self.unassign(assignment, var)
+            self.undo_to(base_mark)
+        return answer, stopped[0]
+
+    # adds a variable with a domain given as a list of values, or already in the problem's domain representation
+        # problems are edited between searches, and the neighbor index is updated rather than rebuilt
+    def add_variable(self, var, domain):
+        self.make_editable()
+        self.variables.append(var)
+        if isinstance(domain, list):
+            domain = self.make_domain(domain)
+        self.current_domains[var] = domain
+        self.neighbors[var] = []
+        self.changed_variables.add(var)
+
+    # removes a variable and all of its constraints
+    def remove_variable(self, var):
+        self.make_editable()
+        for neighbor in set(self.neighbors[var]):
+            self.drop_arcs(var, neighbor)
+        self.variables.remove(var)
+        del self.current_domains[var]
+        del self.neighbors[var]
+        self.changed_variables.discard(var)
+        self.edited_domains.discard(var)
+
+    # adds the binary constraint between var1 and var2, as an arc each way like the problems' own constraints
+    def add_constraint(self, var1, var2):
+        self.make_editable()
+        for arc in ((var1, var2), (var2, var1)):
+            if arc[1] not in self.neighbors[arc[0]]:
+                self.constraints[arc] = None
+                self.neighbors[arc[0]].append(arc[1])
+                self.residues.pop(arc, None)
+
+    # removes the binary constraint between var1 and var2, both arcs of it
+    def remove_constraint(self, var1, var2):
+        self.make_editable()
+        self.drop_arcs(var1, var2)
+
+    # removes both arcs between var1 and var2 from the constraints and the neighbor index, with their residues and weight
+    def drop_arcs(self, var1, var2):
+        for arc in ((var1, var2), (var2, var1)):
+            self.constraints.pop(arc, None)
+            while arc[1] in self.neighbors[arc[0]]:
+                self.neighbors[arc[0]].remove(arc[1])
+            self.residues.pop(arc, None)
+        self.constraint_weights.pop(frozenset((var1, var2)), None)
+
+    # adds a value to a variable's domain
+    def add_value(self, var, value):
+        domain = self.current_domains[var]
+        if value in domain:
+            return
+        if isinstance(domain, list):
+            self.current_domains[var] = domain + [value]
+        else:
+            self.current_domains[var] = domain.with_values((value,))
+        self.edited_domains.add(var)
+
+    # removes a value from a variable's domain
+    def remove_value(self, var, value):
+        domain = self.current_domains[var]
+        if value not in domain:
+            return
+        if isinstance(domain, list):
+            self.current_domains[var] = [x for x in domain if x != value]
+        else:
+            self.current_domains[var] = domain.without((value,))
+        self.edited_domains.add(var)
+        self.changed_variables.add(var)
+
+    # builds a domain holding values in the representation the problem's domains use
+    def make_domain(self, values):
+        if not self.bitset_on:
+            return list(values)
+        # share the universe of an existing bitset domain, adding any new values to it
+        for domain in self.current_domains.values():
+            if isinstance(domain, BitsetDomain):
+                return BitsetDomain(domain.values, domain.index, 0).with_values(values)
+        universe, index = BitsetDomain.make_universe(values)
+        return BitsetDomain.from_values(universe, index, values)
 
-    # recusirely called helper for backtracking_search
+    # switches the constraints to a dictionary keyed by arc, in their original order, and the neighbor index to a
+        # dictionary of lists if it is not one already, e.g. when it is a CompactGraph, so both are edited in place
+        # and an edit only costs the degrees of the variables it touches
+    def make_editable(self):
+        if not isinstance(self.constraints, dict):
+            arcs = {}
+            for constraint in self.constraints:
+                arcs[tuple(constraint)] = None
+            self.constraints = arcs
+        if not isinstance(self.neighbors, dict):
+            neighbors = {}
+            for var in self.variables:
+                neighbors[var] = list(self.neighbors[var])
+            self.neighbors = neighbors
+
+    # lazily yields every solution, each as its own dictionary
+    def iter_solutions(self, mrv_on, deg_on, lcv_on, ac3_on):
+        for solution in self.iterative_backtracking({}, mrv_on, deg_on, lcv_on, ac3_on):  # initial assignment is empty
+            yield dict(solution)
+
+    # counts solutions, stopping early once limit of them have been found
+    def count_solutions(self, mrv_on, deg_on, lcv_on, ac3_on, limit=None):
+        count = 0
+        solutions = self.iterative_backtracking({}, mrv_on, deg_on, lcv_on, ac3_on)
+        for solution in solutions:
+            count += 1
+            if limit is not None and count >= limit:
+                break
+        solutions.close()
+        return count
+
+    # search helper that keeps an explicit stack of frames instead of recursing, so its depth is not limited
+        # yields the live assignment every time it is complete, callers must copy it to keep it
+        # when the search finishes or is closed early, assignment and current_domains are restored
+        # root is an optional (variable, values) pair to start from instead of selecting the first variable,
+        # in which case current_domains are taken to be arc consistent already
+        # with split_on_stop, a search stopped by should_stop leaves what it did not explore in open_subproblems
+    def iterative_backtracking(self, assignment, mrv_on, deg_on, lcv_on, ac3_on, root=None, split_on_stop=False):
+        base_mark = len(self.trail)
+        self.interrupted = False
+        self.open_subproblems = []
+        # each frame is (variable, iterator over its remaining ordered values, trail mark before assigning it)
+        stack = []
+
+        try:
+            if root is not None:
+                stack.append((root[0], iter(root[1]), len(self.trail)))
+            else:
+                # make the whole problem arc consistent once, so each assignment only needs to propagate from itself
+                if ac3_on and not self.propagate():
+                    return
+
+                # check if assignment is already complete
+                if self.is_complete(assignment):
+                    yield assignment
+                    return
+
+                self.push_frame(stack, assignment, mrv_on, deg_on, lcv_on)
+
+            while stack:
+                # give up if asked to stop
+                if self.should_stop is not None and self.should_stop():
+                    self.interrupted = True
+                    return
+
+                var, values, trail_mark = stack[-1]
+
+                # undo the value this frame tried last time it was on top of the stack
+                if var in assignment:
+                    self.unassign(assignment, var)
+                    self.undo_to(trail_mark)
+
+                # move on to the next value that is consistent and survives ac3
+                stats = self.stats
+                for value in values:
+                    if stats is not None:
+                        stats.consistency_checks += 1
+                    if self.is_consistent(assignment, var, value):
+                        self.assign(assignment, var, value)
+                        self.assign_domain(var, value)
+                        if not ac3_on or self.propagate(var):
+                            if stats is not None and stats.on_assign is not None:
+                                stats.on_assign(var, value)
+                            break
+                        # ac3 found a failure, undo and try the next value
+                        self.unassign(assignment, var)
+                        self.undo_to(trail_mark)
+                else:
+                    # no values left for var, backtrack to the previous frame
+                    stack.pop()
+                    if self.wdeg_on and not ac3_on:
+                        # without ac3 there are no wipeouts, so blame var's constraints with the assigned variables
+                        for neighbor in self.neighbors[var]:
+                            if neighbor in assignment:
+                                self.increase_weight(var, neighbor)
+                    if stats is not None:
+                        stats.backtracks += 1
+                        if stats.on_backtrack is not None:
+                            stats.on_backtrack(var)
+                    continue
+
+                # check if assignment is complete
+                if self.is_complete(assignment):
+                    yield assignment
+                    continue
+
+                # select the next unassigned variable and push its frame
+                self.push_frame(stack, assignment, mrv_on, deg_on, lcv_on)
+
+        finally:
+            # remove anything this search added to the assignment and restore current_domains
+            while stack:
+                var, values, trail_mark = stack.pop()
+                if var in assignment:
+                    self.unassign(assignment, var)
+                self.undo_to(trail_mark)
+                if self.interrupted and split_on_stop:
+                    # every value this frame has not tried yet roots an unexplored subtree
+                    values = list(values)
+                    if values:
+                        self.open_subproblems.append((dict(assignment), self.changed_domains(base_mark), var, values))
+            self.undo_to(base_mark)
+            # hand out the shallowest, and usually largest, subtrees first
+            self.open_subproblems.reverse()
+
+    # conflict-directed backjumping search, returns the first solution found or False if there is none
+        # each frame gathers the assigned variables to blame for its values failing, and when it runs out of values
+        # the search jumps straight back to the most recently assigned of them instead of the previous variable
+        # with nogood_limit, up to that many learned nogoods are kept (least recently used evicted first)
+        # and values that would complete one are skipped
+    def backjumping_search(self, mrv_on, deg_on, lcv_on, ac3_on, nogood_limit=None):
+        base_mark = len(self.trail)
+        self.interrupted = False
+        nogoods = None if not nogood_limit else NogoodStore(nogood_limit)
+        assignment = {}
+        # frames are (variable, iterator over its remaining ordered values, trail mark) as in iterative_backtracking
+        stack = []
+        # conflict set of each frame, and the stack position of each assigned variable
+        conflicts = []
+        position = {}
+
+        try:
+            # make the whole problem arc consistent once, so each assignment only needs to propagate from itself
+            if ac3_on and not self.propagate():
+                return False
+            if self.is_complete(assignment):
+                return {}
+            self.push_backjumping_frame(stack, conflicts, assignment, mrv_on, deg_on, lcv_on)
+
+            while stack:
+                # give up if asked to stop
+                if self.should_stop is not None and self.should_stop():
+                    self.interrupted = True
+                    return False
+
+                var, values, trail_mark = stack[-1]
+                conflict_set = conflicts[-1]
+
+                # undo the value this frame tried last time it was on top of the stack
+                if var in assignment:
+                    self.unassign(assignment, var)
+                    del position[var]
+                    self.undo_to(trail_mark)
+
+                # move on to the next value, blaming the assigned variables responsible for each one that fails
+                stats = self.stats
+                for value in values:
+                    if nogoods is not None:
+                        culprits = nogoods.violated(assignment, var, value)
+                        if culprits is not None:
+                            conflict_set |= culprits
+                            continue
+                    if stats is not None:
+                        stats.consistency_checks += 1
+                    if not self.is_consistent(assignment, var, value):
+                        conflict_set |= self.find_conflicts(assignment, var, value)
+                        continue
+                    self.assign(assignment, var, value)
+                    position[var] = len(stack) - 1
+                    self.assign_domain(var, value)
+                    if not ac3_on or self.propagate(var):
+                        if stats is not None and stats.on_assign is not None:
+                            stats.on_assign(var, value)
+                        break
+                    # ac3 does not say which assignments caused the wipeout, so blame all of them
+                    self.unassign(assignment, var)
+                    del position[var]
+                    self.undo_to(trail_mark)
+                    conflict_set.update(assignment)
+                else:
+                    # no values left for var, so its conflict set is to blame
+                    stack.pop()
+                    conflicts.pop()
+                    if stats is not None:
+                        stats.backtracks += 1
+                        if stats.on_backtrack is not None:
+                            stats.on_backtrack(var)
+                    # values removed from var's domain by earlier propagation were caused by assignments up to that point
+                    conflict_set |= self.pruning_culprits(var, stack, base_mark)
+
+                    # nobody to blame means no solution exists
+                    if not conflict_set:
+                        return False
+
+                    # learn the culprits' values as a nogood, unless it is the whole current path, which cannot come up again
+                    if nogoods is not None and len(conflict_set) < len(assignment):
+                        learned = {}
+                        for culprit in conflict_set:
+                            learned[culprit] = assignment[culprit]
+                        nogoods.add(learned)
+
+                    # jump back to the most recently assigned culprit, undoing every frame above it
+                    target = max(position[culprit] for culprit in conflict_set)
+                    while len(stack) > target + 1:
+                        jumped_var, jumped_values, jumped_mark = stack.pop()
+                        conflicts.pop()
+                        self.unassign(assignment, jumped_var)
+                        del position[jumped_var]
+                        self.undo_to(jumped_mark)
+                    # the culprit inherits the rest of the blame
+                    conflict_set.discard(stack[-1][0])
+                    conflicts[-1] |= conflict_set
+                    continue
+
+                # check if assignment is complete
+                if self.is_complete(assignment):
+                    return dict(assignment)
+
+                self.push_backjumping_frame(stack, conflicts, assignment, mrv_on, deg_on, lcv_on)
+
+            return False
+
+        finally:
+            # restore the assignment and current_domains
+            while stack:
+                var, values, trail_mark = stack.pop()
+                if var in assignment:
+                    self.unassign(assignment, var)
+            self.undo_to(base_mark)
+
+    # pushes the next frame for backjumping_search, along with its conflict set
+        # values of the domain that value ordering left out are blamed on the assignments they conflict with
+    def push_backjumping_frame(self, stack, conflicts, assignment, mrv_on, deg_on, lcv_on):
+        self.push_frame(stack, assignment, mrv_on, deg_on, lcv_on)
+        var, values, trail_mark = stack[-1]
+        conflict_set = set()
+
+        ordered = list(values)
+        if len(ordered) < len(self.current_domains[var]):
+            ordered_set = set(ordered)
+            for value in self.current_domains[var]:
+                if value not in ordered_set:
+                    conflict_set |= self.find_conflicts(assignment, var, value)
+
+        stack[-1] = (var, iter(ordered), trail_mark)
+        conflicts.append(conflict_set)
+
+    # returns the assigned variables that value for var conflicts with
+        # if found_consistent does not explain why is_consistent rejected value, every assigned variable is blamed
+    def find_conflicts(self, assignment, var, value):
+        culprits = set()
+        for neighbor in self.neighbors[var]:
+            if neighbor in assignment and not self.found_consistent(var, neighbor, value, assignment[neighbor]):
+                culprits.add(neighbor)
+        if not culprits:
+            culprits.update(assignment)
+        return culprits
+
+    # returns the assigned variables to blame for values missing from var's current domain
+        # ac3 removed them while propagating some frame's assignment, which depended on every assignment up to that frame
+    def pruning_culprits(self, var, stack, base_mark):
+        culprits = set()
+        # find the latest trail entry that changed var's domain
+        for i in range(len(self.trail) - 1, base_mark - 1, -1):
+            if self.trail[i][0] == var:
+                # blame the frame it was recorded under and every frame below it
+                for frame in stack:
+                    if frame[2] <= i:
+                        culprits.add(frame[0])
+                break
+        return culprits
+
+    # selects the next unassigned variable and pushes its frame onto the search stack
+    def push_frame(self, stack, assignment, mrv_on, deg_on, lcv_on):
+        stats = self.stats
+        if stats is None:
+            var = self.select_unassigned_variable(assignment, mrv_on, deg_on)
+            stack.append((var, iter(self.order_domain_values(assignment, var, lcv_on)), len(self.trail)))
+            return
+
+        # same as above, timing the selection and ordering phases
+        start = perf_counter()
+        var = self.select_unassigned_variable(assignment, mrv_on, deg_on)
+        selected = perf_counter()
+        values = self.order_domain_values(assignment, var, lcv_on)
+        stats.selection_time += selected - start
+        stats.ordering_time += perf_counter() - selected
+
+        stack.append((var, iter(values), len(self.trail)))
+        stats.nodes += 1
+        if len(stack) > stats.max_depth:
+            stats.max_depth = len(stack)
+
+    # runs ac3 for the search, timing it when stats are being recorded
+    def propagate(self, var=None):
+        if self.stats is None:
+            return self.ac3(var)
+        start = perf_counter()
+        result = self.ac3(var)
+        self.stats.propagation_time += perf_counter() - start
+        return result
+
+    # recursive version of the search, kept for callers that drive it directly
     def recursive_backtracking(self, assignment, mrv_on, deg_on, lcv_on, ac3_on):
 
         # check if assignment is completes
@@ -31,14 +1050,14 @@ class ConstraintSatisfactionProblem:
             # check if value assignment would be consistent with current assignment given constraints
             if self.is_consistent(assignment, var, value):
                 # add variable-value pair to the assignment
-                assignment[var] = value
-                # save copy of current_domains in case ac3 later fails
-                current_domains_copy = deepcopy(self.current_domains)
+                self.assign(assignment, var, value)
+                # mark the trail so any domain changes below can be undone if ac3 later fails
+                trail_mark = len(self.trail)
                 # update variable's value in current_domains
-                self.current_domains[var] = [value]
+                self.assign_domain(var, value)
 
                 if ac3_on:  # ac3 inference to detect failure early
-                    if self.ac3(): 
+                    if self.ac3(var):
                         # recurse on updated assignmnet
                         result = self.recursive_backtracking(assignment, mrv_on, deg_on, lcv_on, ac3_on)
                         # check that result is not failure
@@ -52,19 +1071,113 @@ class ConstraintSatisfactionProblem:
                         return result
 
                 # assignment was a failure, time to remove variable from assignment and backtrack 
-                del assignment[var]
+                self.unassign(assignment, var)
                 # restore current_domains to its previous state
-                self.current_domains = current_domains_copy
+                self.undo_to(trail_mark)
                 
         # no values satisfy all constraints, return failure
         return False
 
+    # replaces a variable's current domain, recording the old one on the trail
+        # domains are never modified in place, so the old list is still valid to restore
+    def set_domain(self, var, domain):
+        self.trail.append((var, self.current_domains[var]))
+        self.current_domains[var] = domain
+
+    # narrows a variable's current domain down to the single assigned value
+    def assign_domain(self, var, value):
+        domain = self.current_domains[var]
+        if isinstance(domain, list):
+            self.set_domain(var, [value])
+        else:
+            self.set_domain(var, domain.only(value))
+
+    # removes a collection of values from a variable's current domain
+    def remove_values(self, var, values):
+        domain = self.current_domains[var]
+        if isinstance(domain, list):
+            values = set(values)
+            self.set_domain(var, [x for x in domain if x not in values])
+        else:
+            self.set_domain(var, domain.without(values))
+
+    # converts list domains to bitset domains sharing one value universe
+    def make_bitset_domains(self, current_domains):
+        # variables sharing one domain list share one bitset domain, which is safe since domains are never changed in place
+        shared = {}  # id of a domain list -> its bitset domain
+        all_values = []
+        for var in current_domains:
+            domain = current_domains[var]
+            if isinstance(domain, list) and id(domain) not in shared:
+                shared[id(domain)] = None
+                all_values.extend(domain)
+        values, index = BitsetDomain.make_universe(all_values)
+
+        bitset_domains = {}
+        for var in current_domains:
+            domain = current_domains[var]
+            if isinstance(domain, list):
+                if shared[id(domain)] is None:
+                    shared[id(domain)] = BitsetDomain.from_values(values, index, domain)
+                bitset_domains[var] = shared[id(domain)]
+            else:   # domain already has a compact representation
+                bitset_domains[var] = domain
+        return bitset_domains
+
+    # returns the current domains of the variables changed since the trail was at trail_mark
+    def changed_domains(self, trail_mark):
+        changed = {}
+        for i in range(trail_mark, len(self.trail)):
+            var = self.trail[i][0]
+            changed[var] = self.current_domains[var]
+        return changed
+
+    # pops the trail back to a saved mark, restoring every domain changed since then
+    def undo_to(self, trail_mark):
+        while len(self.trail) > trail_mark:
+            var, domain = self.trail.pop()
+            self.current_domains[var] = domain
+
+    # adds a variable-value pair to the assignment
+        # subclasses can override assign and unassign to keep running state in step with the search
+    def assign(self, assignment, var, value):
+        assignment[var] = value
+
+    # removes a variable from the assignment
+    def unassign(self, assignment, var):
+        del assignment[var]
+
     # checks if assignment is complete
     def is_complete(self, assignment):
         if len(assignment) == len(self.variables):
             return True
         return False
 
+    # checks that assignment gives every variable a value from its domain that satisfies every constraint
+    def is_solution(self, assignment):
+        if len(assignment) != len(self.variables):
+            return False
+        for var in self.variables:
+            if var not in assignment or assignment[var] not in self.current_domains[var]:
+                return False
+            for neighbor in self.neighbors[var]:
+                if not self.found_consistent(var, neighbor, assignment[var], assignment[neighbor]):
+                    return False
+        return True
+
+    # returns a canonical (key, order) pair describing the problem up to renaming its variables, for SolveCache
+        # problems with equal keys are the same problem once variable order[i] of each is renamed to i
+        # constraints are opaque here, so the base problem has no fingerprint and returns None
+    def fingerprint(self):
+        return None
+
+    # builds an assignment of this problem from solution values listed in fingerprint order
+    def remap_solution(self, values, order):
+        assignment = {}
+        for i in range(len(order)):
+            assignment[order[i]] = values[i]
+        return assignment
+
     # returns domain values for a variable
     def order_domain_values(self, assignment, var, lcv_on):
         if lcv_on:   # use the least constraining value heuristic to order variable's domain values
@@ -74,7 +1187,9 @@ class ConstraintSatisfactionProblem:
 
     # selects unassigned variable
     def select_unassigned_variable(self, assignment, mrv_on, deg_on):
-        if mrv_on:  # use min remaining value heuristic to select variable
+        if self.wdeg_on:    # use the adaptive dom/wdeg heuristic to select variable
+            return self.wdeg_heuristic(assignment)
+        elif mrv_on:  # use min remaining value heuristic to select variable
             return self.mrv_heuristic(assignment, deg_on)
         else:   # choose first unassigned variable we find
             for var in self.variables:
@@ -82,6 +1197,42 @@ class ConstraintSatisfactionProblem:
                     return var
             return None
         
+    # dom/wdeg heuristic chooses the variable with the fewest legal values per weight of constraints on remaining variables
+    def wdeg_heuristic(self, assignment):
+        best_score = float('inf')
+        ties = []
+
+        for var in self.variables:
+            if var not in assignment:
+                # add up the weights of var's constraints with unassigned variables
+                weighted_degree = 0
+                for neighbor in self.neighbors[var]:
+                    if neighbor not in assignment:
+                        weighted_degree += self.constraint_weights.get(frozenset((var, neighbor)), 1)
+
+                # a variable with no constraints left is chosen last
+                if weighted_degree == 0:
+                    score = float('inf')
+                else:
+                    score = len(self.current_domains[var]) / weighted_degree
+
+                if score < best_score or not ties:
+                    best_score = score
+                    ties = [var]
+                elif score == best_score:
+                    ties.append(var)
+
+        if not ties:
+            return None
+        elif self.rng is not None:  # break ties randomly
+            return self.rng.choice(ties)
+        return ties[0]
+
+    # raises the weight of the constraint between var1 and var2 after it caused a failure
+    def increase_weight(self, var1, var2):
+        key = frozenset((var1, var2))
+        self.constraint_weights[key] = self.constraint_weights.get(key, 1) + 1
+
     # minimum remaining values heuristic chooses the variable with the fewest legal values
     def mrv_heuristic(self, assignment, deg_on):
         min_remaining_values = float('inf')
@@ -105,6 +1256,8 @@ class ConstraintSatisfactionProblem:
 
         if deg_on:  # use degree heuristic to break the ties
             return self.degree_heuristic(assignment, ties)
+        elif self.rng is not None:  # break ties randomly
+            return self.rng.choice(ties)
         else:   # choose first variable we find
             return ties[0]
 
@@ -124,50 +1277,153 @@ class ConstraintSatisfactionProblem:
                 if num_constraints > max_constraints:
                     max_constraints = num_constraints
                     best_var = var
+                    best_vars = [var]
+                elif num_constraints == max_constraints:
+                    best_vars.append(var)
+
+        # break remaining ties randomly
+        if self.rng is not None and best_var is not None:
+            return self.rng.choice(best_vars)
  
         return best_var
 
     # inference technique that checks arc consistency of binary constraints
-    def ac3(self):
+        # given the newly assigned var, only arcs into var are queued to start (maintaining arc consistency)
+    def ac3(self, var=None):
         arc_queue = deque()
+        # arcs currently waiting in the queue, so none is queued twice
+        queued = set()
 
-        # copy all binary contraints into queue
-        for constraint in self.constraints:
-            arc_queue.append(constraint)
+        if var is None:
+            # copy all binary contraints on the problem's variables into queue
+            for var1 in self.variables:
+                for var2 in self.neighbors[var1]:
+                    arc = (var1, var2)
+                    if arc not in queued:
+                        queued.add(arc)
+                        arc_queue.append(arc)
+        else:
+            # only var's domain changed, so only its neighbors can lose support
+            for neighbor in self.neighbors[var]:
+                arc = (neighbor, var)
+                if arc not in queued:
+                    queued.add(arc)
+                    arc_queue.append(arc)
 
         while arc_queue:
-            var1, var2 = arc_queue.popleft()
+            arc = arc_queue.popleft()
+            queued.discard(arc)
+            var1, var2 = arc
             # check if latest assignment created any inconsistencies
             if self.remove_inconsistent_values(var1, var2):
+                # var1 has no more domain options, return failure
+                if not self.current_domains[var1]:
+                    # the wipeout is blamed on this constraint when dom/wdeg is choosing variables
+                    if self.wdeg_on:
+                        self.increase_weight(var1, var2)
+                    return False
                 # recheck all constraints involving var1 if any updates to it's current domain values
-                for constraint in self.constraints:
-                    if constraint[0] == var1:
-                        arc_queue.append((constraint[1],var1))
-
-        # check if any variable now has no more domain options 
-        for var in self.current_domains:
-            if not self.current_domains[var]:
-                # if so we return failure
-                return False
+                    # var2's values cannot lose support, since every removed value had none in var2
+                for neighbor in self.neighbors[var1]:
+                    arc = (neighbor, var1)
+                    if neighbor != var2 and arc not in queued:
+                        queued.add(arc)
+                        arc_queue.append(arc)
+
+        if var is None:
+            # check if any variable now has no more domain options 
+            for var in self.variables:
+                if not self.current_domains[var]:
+                    # if so we return failure
+                    return False
         
         return True 
 
+    # returns a hashable description of the constraint between var1 and var2, or None if only found_consistent knows it
+        # arcs with equal descriptions must constrain their values the same way, so they can share compiled supports
+        # "!=" is understood here, and subclasses can compile their own descriptions in find_unsupported
+    def constraint_type(self, var1, var2):
+        return None
+
+    # returns the values of var1 with no support in var2's domain using the compiled form of a constraint of type kind,
+        # or None when there is no compiled form and remove_inconsistent_values must call found_consistent
+    def find_unsupported(self, var1, var2, kind):
+        domain1 = self.current_domains[var1]
+        domain2 = self.current_domains[var2]
+
+        # x != y has a support unless var2 is down to the single value x
+        if kind == "!=":
+            if len(domain2) > 1:
+                return []
+            if not domain2:
+                return list(domain1)
+            for y in domain2:
+                return [y] if y in domain1 else []
+
+        # bitset domains over one universe, each value's supports are a bitmask and checking one is a single AND
+        if isinstance(domain1, BitsetDomain) and isinstance(domain2, BitsetDomain) and domain1.index is domain2.index:
+            table = self.support_tables.setdefault(kind, {})
+            to_delete = []
+            for x in domain1:
+                entry = table.get(x)
+                # build the mask the first time x is checked, or again once the universe has grown
+                if entry is None or entry[0] != len(domain2.values):
+                    mask = 0
+                    for i in range(len(domain2.values)):
+                        if self.found_consistent(var1, var2, x, domain2.values[i]):
+                            mask |= 1 << i
+                    if self.stats is not None:
+                        self.stats.found_consistent_calls += len(domain2.values)
+                    entry = (len(domain2.values), mask)
+                    table[x] = entry
+                if domain2.bits & entry[1] == 0:
+                    to_delete.append(x)
+            return to_delete
+
+        return None
+
     # helper for ac3 that checks for any inconsistencies from latest assignment
     def remove_inconsistent_values(self, var1, var2):
+        # use the constraint's compiled form when it has one
+        kind = self.constraint_type(var1, var2)
+        if kind is not None:
+            to_delete = self.find_unsupported(var1, var2, kind)
+            if to_delete is not None:
+                if to_delete:
+                    self.remove_values(var1, to_delete)
+                self.record_revision(var1, to_delete, 0)
+                return len(to_delete) > 0
+
         removed = False
 
         # list of any inconsistent domain options that need to be deleted
         to_delete = []
+
+        domain2 = self.current_domains[var2]
+        # supports found for var1's values on earlier revisions of this arc
+        arc_residues = self.residues.get((var1, var2))
+        if arc_residues is None:
+            arc_residues = {}
+            self.residues[(var1, var2)] = arc_residues
         
         # loop through all var1's current domain options
             # check if there is some y in var2's domains that would make x consistent with it
+        checks = 0
         for x in self.current_domains[var1]:
+            # the last support found for x is usually still there, so try it first
+            if x in arc_residues and arc_residues[x] in domain2:
+                continue
+
             found_option = False
             # loop through all var2's current domain options
-            for y in self.current_domains[var2]:
+            for y in domain2:
+                checks += 1
                 # checks if x and y would be consistent assignments with constraints on var1 and var2
                 if self.found_consistent(var1,var2,x,y):
                     found_option = True
+                    # remember the support and stop at the first one
+                    arc_residues[x] = y
+                    break
             
             # did not find any y that would make var2 consistent with var1 should it be assigned x
             if not found_option:
@@ -175,7 +1431,19 @@ class ConstraintSatisfactionProblem:
                 removed = True
         
         # delete all inconsistent values from var1's current domain options
-        for v in to_delete:
-            self.current_domains[var1].remove(v)
+        if removed:
+            self.remove_values(var1, to_delete)
+
+        self.record_revision(var1, to_delete, checks)
+        return removed
 
-        return removed
\ No newline at end of file
+    # records one arc revision that removed to_delete from var1's domain after checks found_consistent calls
+    def record_revision(self, var1, to_delete, checks):
+        stats = self.stats
+        if stats is not None:
+            stats.revisions += 1
+            stats.found_consistent_calls += checks
+            if to_delete:
+                stats.values_pruned += len(to_delete)
+                if stats.on_prune is not None:
+                    stats.on_prune(var1, to_delete)
@@ -1,18 +1,40 @@
 # Author: Annabel Revers
 # Date:   October 2021
 
+import math
+
+from CompactGraph import CompactGraph
 from ConstraintSatisfactionProblem import ConstraintSatisfactionProblem
 
 class MapProblem(ConstraintSatisfactionProblem):
 
-    def __init__(self, states, colors, map):
+    def __init__(self, states, colors, map, bitset_on=False, symmetry_on=True):
         # human readbale problem information
-        self.states = states
+        self.states = list(states)  # copied, since add_state appends to it
         self.colors = colors
-        self.map = map  # contains all binary constaints on states
+        self.map = map  # contains all binary constaints on states, as a list of pairs or a CompactGraph
+
+        # look states up by name instead of searching the list, for building constraints and for edits
+        self.state_ints = {}
+        for i in range(len(self.states)):
+            self.state_ints[self.states[i]] = i
+
+        # colors are interchangeable, so with symmetry_on the first state colored gets color 0 and every
+            # new color is at most one above the highest color used so far, which skips relabeled colorings
+        self.symmetry_on = symmetry_on
+        self.color_counts = [0] * len(colors)  # number of states in the tracked assignment with each color
+        self.max_color = -1  # highest color used by the tracked assignment
+        self.colored = None  # assignment the counts describe
+        self.colored_count = 0
 
         # pass variables, current domains, and constraints to superclass
-        super().__init__(self.states_to_ints(), self.make_current_domains(), self.make_constraints())
+        super().__init__(self.states_to_ints(), self.make_current_domains(), self.make_constraints(), bitset_on)
+
+    # builds a problem from a CompactGraph, e.g. one loaded by CompactGraph.read_dimacs or CompactGraph.load
+        # the graph's arrays are used as the neighbor index directly, so no per-state lists are built
+    @staticmethod
+    def from_graph(graph, colors, bitset_on=False, symmetry_on=True):
+        return MapProblem(graph.names, colors, graph, bitset_on, symmetry_on)
     
     # convert states to integers
     def states_to_ints(self):
@@ -25,64 +47,254 @@ class MapProblem(ConstraintSatisfactionProblem):
     def make_current_domains(self):
         current_domains = {}
         # start each state's list of domains as all possible colors
+            # domains are replaced rather than changed in place, so every state can share one list
+        options = []
+        for j in range(len(self.colors)):
+            options.append(j)
         for i in range(len(self.states)):
-            options = []
-            for j in range(len(self.colors)):
-                options.append(j)
             current_domains[i] = options
         return current_domains
 
     # convert map constraints to integers constarints
     def make_constraints(self):
+        # a CompactGraph already numbers states by position and yields its arcs as integer pairs
+        if isinstance(self.map, CompactGraph):
+            return self.map
+
         int_constraints = []
         for constraint in self.map:
-            int1 = self.states.index(constraint[0])
-            int2 = self.states.index(constraint[1])
+            int1 = self.state_ints[constraint[0]]
+            int2 = self.state_ints[constraint[1]]
             int_constraints.append((int1, int2))
         return int_constraints
+
+    # uses a CompactGraph's arrays as the neighbor index instead of building a list per state
+    def make_neighbors(self):
+        if isinstance(self.map, CompactGraph):
+            return self.map.neighbor_view()
+        return super().make_neighbors()
+
+    # adds a state that can take every color, bordering the named states, and returns its variable
+    def add_state(self, state, borders=()):
+        var = len(self.states)
+        self.states.append(state)
+        self.state_ints[state] = var
+        options = []
+        for j in range(len(self.colors)):
+            options.append(j)
+        self.add_variable(var, options)
+        for other in borders:
+            self.add_constraint(var, self.state_ints[other])
+        return var
+
+    # removes the named state and its borders, other states keep their variables
+    def remove_state(self, state):
+        self.remove_variable(self.state_ints.pop(state))
+
+    # adds a border between two named states
+    def add_border(self, state1, state2):
+        self.add_constraint(self.state_ints[state1], self.state_ints[state2])
+
+    # removes the border between two named states
+    def remove_border(self, state1, state2):
+        self.remove_constraint(self.state_ints[state1], self.state_ints[state2])
+
+    # with symmetry_on, counts a component's canonical colorings by the number of colors each uses, see merge_component
+    def solve_component(self, component, options, mode):
+        if mode != "count" or not self.symmetry_on:
+            return super().solve_component(component, options, mode)
+        all_variables = self.variables
+        self.variables = component
+        try:
+            counts = {}
+            for solution in self.iterative_backtracking({}, *options):
+                used = len(set(solution.values()))
+                counts[used] = counts.get(used, 0) + 1
+            return counts
+        finally:
+            self.variables = all_variables
+
+    # with symmetry_on, merges the canonical counts of components into canonical colorings of them all together
+        # result maps the number of colors used so far to the number of canonical colorings with that many
+        # a component's coloring with j colors can give t of them colors already used, in C(j, t) * P(used, t) ways,
+        # while its other colors are new, with labels fixed by the order they first appear in
+    def merge_component(self, result, answer, mode):
+        if mode != "count" or not self.symmetry_on:
+            return super().merge_component(result, answer, mode)
+        if not isinstance(result, dict):   # nothing merged yet
+            result = {0: result}
+        merged = {}
+        for used in result:
+            for j in answer:
+                for t in range(min(used, j) + 1):
+                    total = used + j - t
+                    if total <= len(self.colors):
+                        ways = result[used] * answer[j] * math.comb(j, t) * math.perm(used, t)
+                        merged[total] = merged.get(total, 0) + ways
+        return merged
+
+    def merged_result(self, result, mode):
+        if isinstance(result, dict) and mode == "count":
+            return sum(result.values())
+        return result
+
+    # colors are only interchangeable while every state can take all of them, so editing a domain turns symmetry_on off
+    def add_value(self, var, value):
+        self.symmetry_on = False
+        super().add_value(var, value)
+
+    def remove_value(self, var, value):
+        self.symmetry_on = False
+        super().remove_value(var, value)
     
+    # pickles the problem without the tracked color counts, which are rebuilt when needed
+    def __getstate__(self):
+        state = super().__getstate__()
+        state["color_counts"] = [0] * len(self.colors)
+        state["max_color"] = -1
+        state["colored"] = None
+        state["colored_count"] = 0
+        return state
+
+    # returns the highest color used by assignment
+        # the running counts are reused when they track this assignment, otherwise they are rebuilt
+        # assign and unassign keep them in step, so the tracked assignment must only be changed through them
+    def max_color_of(self, assignment):
+        if assignment is not self.colored or len(assignment) != self.colored_count:
+            self.color_counts = [0] * len(self.colors)
+            self.max_color = -1
+            for var in assignment:
+                self.color_counts[assignment[var]] += 1
+                self.max_color = max(self.max_color, assignment[var])
+            self.colored = assignment
+            self.colored_count = len(assignment)
+        return self.max_color
+
+    # adds a state's color to the assignment, counting it when breaking color symmetry
+        # a state already colored is recolored, uncounting its old color first
+    def assign(self, assignment, var, value):
+        if self.symmetry_on:
+            self.max_color_of(assignment)
+            if var in assignment:
+                self.color_counts[assignment[var]] -= 1
+            else:
+                self.colored_count += 1
+            self.color_counts[value] += 1
+            self.max_color = max(self.max_color, value)
+            while self.max_color >= 0 and self.color_counts[self.max_color] == 0:
+                self.max_color -= 1
+        super().assign(assignment, var, value)
+
+    # removes a state's color from the assignment, uncounting it when breaking color symmetry
+    def unassign(self, assignment, var):
+        if self.symmetry_on:
+            self.max_color_of(assignment)
+            self.color_counts[assignment[var]] -= 1
+            while self.max_color >= 0 and self.color_counts[self.max_color] == 0:
+                self.max_color -= 1
+            self.colored_count -= 1
+        super().unassign(assignment, var)
+
     # checks if value assignment for var would be consistent with current assignment
     def is_consistent(self, assignment, var, value):
 
-        # loop through all constraints
-        for constraint in self.constraints:
-            # check if constraint involves var
-            if constraint[0] == var:
-                # check if neighbor is in assignment already
-                if constraint[1] in assignment:
-                    # check neighbor color
-                    if assignment[constraint[1]] == value:
-                        # found conflict, return false
-                        return False
+        # skip colors that would only relabel a coloring already covered by a lower color
+        if self.symmetry_on and value > self.max_color_of(assignment) + 1:
+            return False
+
+        # loop through all of var's neighbors
+        for neighbor in self.neighbors[var]:
+            # check if neighbor is in assignment already
+            if neighbor in assignment:
+                # check neighbor color
+                if assignment[neighbor] == value:
+                    # found conflict, return false
+                    return False
         
         # no conflict with current constraints, return true
         return True
 
+    # returns a canonical (key, order) pair for SolveCache, the number of colors, the borders and each state's colors
+        # states are ordered by color refinement (Weisfeiler-Lehman), which ranks each state by its degree and colors,
+        # then by the ranks of its neighbors, until the ranks stop splitting, so the order ignores the states' names
+        # states left tied are told apart by picking one of them at a time, up to individualize_limit times,
+        # then by their position in the states list, so a few relabeled maps with many ties may get another key
+    def fingerprint(self, individualize_limit=32):
+        ranks = {}
+        for var in self.variables:
+            ranks[var] = (len(self.neighbors[var]), tuple(self.current_domains[var]))
+        ranks = self.refine_ranks(ranks)
+
+        for i in range(individualize_limit):
+            # the lowest rank shared by several states with neighbors, ties between isolated states never matter
+            members = {}
+            for var in self.variables:
+                if len(self.neighbors[var]) > 0:
+                    members.setdefault(ranks[var], []).append(var)
+            tied = [rank for rank in members if len(members[rank]) > 1]
+            if not tied:
+                break
+            # rank the first tied state just below the others and refine again
+            ranks[members[min(tied)][0]] -= 0.5
+            ranks = self.refine_ranks(ranks)
+
+        order = sorted(self.variables, key=lambda var: (ranks[var], var))
+        position = {}
+        for i in range(len(order)):
+            position[order[i]] = i
+        borders = []
+        for var in self.variables:
+            for neighbor in self.neighbors[var]:
+                borders.append((position[var], position[neighbor]))
+        borders.sort()
+        domains = []
+        for var in order:
+            domains.append(tuple(self.current_domains[var]))
+        return ("MapProblem", len(self.colors), len(self.variables), tuple(borders), tuple(domains)), order
+
+    # splits states with equal ranks by the sorted ranks of their neighbors until no rank splits further
+        # new ranks are positions in the sorted list of (rank, neighbor ranks) signatures, so they ignore state names
+    def refine_ranks(self, ranks):
+        while True:
+            signatures = {}
+            for var in self.variables:
+                neighbor_ranks = []
+                for neighbor in self.neighbors[var]:
+                    neighbor_ranks.append(ranks[neighbor])
+                neighbor_ranks.sort()
+                signatures[var] = (ranks[var], tuple(neighbor_ranks))
+
+            new_ranks = {}
+            for signature in sorted(set(signatures.values())):
+                new_ranks[signature] = len(new_ranks)
+            refined = {}
+            for var in self.variables:
+                refined[var] = new_ranks[signatures[var]]
+
+            # signatures include the old rank, so the ranks only ever split, and stop once their number holds
+            if len(new_ranks) == len(set(ranks.values())):
+                return refined
+            ranks = refined
+
     # gets the number of constraints a state has on remaining unassigned variables
     def get_num_constraints(self, var):
         # num constraints based on number of neighbors
-        neighbors = 0
-        for constraint in self.constraints:
-            if constraint[0] == var:
-                neighbors += 1
-        return neighbors
+        return len(self.neighbors[var])
 
     # least constraining value chooses the variable that rules out the least number of values
     def lcv_heuristic(self, assignment, var):
         # make array to keep track of number values each values rules out for its neighbors
         ruled_out_array = []
-        for i in range(len(self.colors)):
+        for i in self.current_domains[var]:
             # make count of how many values this assignment would leave remaining
             remaining_values = 0
             # check constraints on neighbors assuming var is assigned this value
-            for constraint in self.constraints:
-                # look for neighbors
-                if constraint[0] == var:
-                    # check if neighbor is unassigned
-                    if constraint[1] not in assignment:
-                        # check if it still has this color as an option
-                        if i in self.current_domains[constraint[1]]:
-                            remaining_values += len(self.current_domains[constraint[1]])-1
+            for neighbor in self.neighbors[var]:
+                # check if neighbor is unassigned
+                if neighbor not in assignment:
+                    # check if it still has this color as an option
+                    if i in self.current_domains[neighbor]:
+                        remaining_values += len(self.current_domains[neighbor])-1
 
             # add value and how many variables it leaves remaining to list
             ruled_out_array.append((i,remaining_values))
@@ -98,6 +310,10 @@ class MapProblem(ConstraintSatisfactionProblem):
 
         return ordered_domains
 
+    # every border requires different colors, which remove_inconsistent_values checks without calling found_consistent
+    def constraint_type(self, var1, var2):
+        return "!="
+
     # helper for ac3's 'remove_inconsistent_values' function
         # checks if x and y would be consistent assignments with constraints on var1 and var2
     def found_consistent(self, var1, var2, x, y):
@@ -105,7 +321,7 @@ class MapProblem(ConstraintSatisfactionProblem):
 
     # converts assignment back to human-readable form and prints
     def print_assignment(self, assignment):
-        for i in range(len(assignment)):
+        for i in sorted(assignment):
             print(self.states[i], "=", self.colors[assignment[i]])
 
 # test code
@@ -162,6 +378,61 @@ if __name__ == "__main__":
     mp4.print_assignment(mp4.backtracking_search(True, True, True, True))
     print("----------")
 
+    # TEST 6: count every solution of MapProblem with the iterative search
+    print("----------------------------------------------")
+    print("Counting MapProblem solutions with mrv, degree, lcv, and ac3...")
+    print("----------------------------------------------")
+    mp6 = MapProblem(variables, domains, constraints)
+    print(mp6.count_solutions(True, True, True, True), "solutions, counting colorings that only swap colors once")
+    print("----------")
+
+    # TEST 7: test MapProblem with min-conflicts local search
+    print("----------------------------------------------")
+    print("Testing MapProblem with min-conflicts...")
+    print("----------------------------------------------")
+    mp7 = MapProblem(variables, domains, constraints)
+    assignment, conflicts = mp7.min_conflicts(max_steps=1000, seed=0)
+    mp7.print_assignment(assignment)
+    print(conflicts, "conflicts")
+    print("----------")
+
+    # TEST 8: test MapProblem loaded from an edge list file, saved, and memory-mapped back
+    print("----------------------------------------------")
+    print("Testing MapProblem loaded from an edge list with mrv, degree, and ac3...")
+    print("----------------------------------------------")
+    import os
+    import tempfile
+    with tempfile.TemporaryDirectory() as directory:
+        with open(os.path.join(directory, "australia.txt"), "w") as f:
+            for constraint in constraints:
+                f.write(constraint[0] + " " + constraint[1] + "\n")
+        graph = CompactGraph.read_edge_list(os.path.join(directory, "australia.txt"))
+        graph.save(os.path.join(directory, "australia.bin"))
+        mp8 = MapProblem.from_graph(CompactGraph.load(os.path.join(directory, "australia.bin"), mmap_on=False), domains)
+        mp8.print_assignment(mp8.backtracking_search(True, True, False, True))
+    print("----------")
 
+    # TEST 9: test adding a state to a solved MapProblem and solving again from the old solution
+    print("----------------------------------------------")
+    print("Testing MapProblem resolve after adding a state...")
+    print("----------------------------------------------")
+    mp9 = MapProblem(variables, domains, constraints)
+    solution = mp9.backtracking_search(True, True, False, True)
+    mp9.add_state("NZ", ["T", "V"])
+    mp9.print_assignment(mp9.resolve(solution, True, True, False, True))
+    print("----------")
 
-  
\ No newline at end of file
+    # TEST 10: test that counting each connected component on its own gives the same count as counting the whole map
+    print("----------------------------------------------")
+    print("Testing MapProblem component counts against whole-map counts...")
+    print("----------------------------------------------")
+    # Tasmania is already its own component, and two islands bordering each other make a third
+    islands = variables + ["I1", "I2"]
+    island_constraints = constraints + [("I1", "I2"), ("I2", "I1")]
+    for symmetry_on in [True, False]:
+        mp10 = MapProblem(islands, domains + ["yellow"], island_constraints, symmetry_on=symmetry_on)
+        by_component = mp10.solve_components(True, True, False, True, mode="count")
+        whole = mp10.count_solutions(True, True, False, True)
+        print("symmetry_on", symmetry_on, ":", by_component, "by component,", whole, "whole map")
+        assert by_component == whole
+    print("----------")
@@ -0,0 +1,53 @@
+# Author: Annabel Revers
+# Date:   October 2021
+
+from collections import OrderedDict
+
+class NogoodStore:
+
+    # bounded store of nogoods, sets of (variable, value) pairs that no solution can contain together
+        # once more than limit nogoods are stored, the least recently used one is evicted
+    def __init__(self, limit):
+        self.limit = limit
+        self.nogoods = OrderedDict()  # frozenset of (variable, value) pairs -> None, least recently used first
+        self.index = {}  # (variable, value) pair -> set of the stored nogoods containing it
+
+    def __len__(self):
+        return len(self.nogoods)
+
+    # adds a nogood, given as a dictionary of variable-value pairs
+    def add(self, pairs):
+        nogood = frozenset(pairs.items())
+        if nogood in self.nogoods:
+            self.nogoods.move_to_end(nogood)
+            return
+
+        self.nogoods[nogood] = None
+        for pair in nogood:
+            self.index.setdefault(pair, set()).add(nogood)
+
+        # evict the least recently used nogood
+        if len(self.nogoods) > self.limit:
+            evicted = self.nogoods.popitem(last=False)[0]
+            for pair in evicted:
+                self.index[pair].discard(evicted)
+                if not self.index[pair]:
+                    del self.index[pair]
+
+    # checks whether assigning value to var would complete a stored nogood
+        # returns the other variables of the first nogood completed, or None if there is none
+    def violated(self, assignment, var, value):
+        for nogood in self.index.get((var, value), ()):
+            matched = True
+            for other, other_value in nogood:
+                if other != var and (other not in assignment or assignment[other] != other_value):
+                    matched = False
+                    break
+            if matched:
+                self.nogoods.move_to_end(nogood)
+                culprits = set()
+                for other, other_value in nogood:
+                    if other != var:
+                        culprits.add(other)
+                return culprits
+        return None
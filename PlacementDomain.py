@@ -0,0 +1,85 @@
+# Author: Annabel Revers
+# Date:   October 2021
+
+class PlacementDomain:
+
+    # domain of (x,y) origins in a grid of columns x rows, such as the origins where a piece fits on a board
+        # bit x*rows+y of bits is set when (x,y) is still in the domain, so values are computed rather than stored
+    __slots__ = ("columns", "rows", "bits")
+
+    def __init__(self, columns, rows, bits):
+        self.columns = columns  # number of x values, 0 to columns-1
+        self.rows = rows  # number of y values, 0 to rows-1
+        self.bits = bits  # integer bitmask of the origins still remaining
+
+    # builds a domain containing every origin of the grid
+    @staticmethod
+    def full(columns, rows):
+        if columns <= 0 or rows <= 0:
+            return PlacementDomain(0, 0, 0)
+        return PlacementDomain(columns, rows, (1 << (columns * rows)) - 1)
+
+    # bit index of an origin, or None if it is outside the grid
+    def index_of(self, value):
+        if 0 <= value[0] < self.columns and 0 <= value[1] < self.rows:
+            return value[0] * self.rows + value[1]
+        return None
+
+    # integer bitmask with the bit of each given origin inside the grid set
+    def mask_of(self, domain_values):
+        mask = 0
+        for value in domain_values:
+            i = self.index_of(value)
+            if i is not None:
+                mask |= 1 << i
+        return mask
+
+    # popcount of the remaining origins
+    def __len__(self):
+        return self.bits.bit_count()
+
+    def __bool__(self):
+        return self.bits != 0
+
+    def __contains__(self, value):
+        i = self.index_of(value)
+        return i is not None and (self.bits >> i) & 1 == 1
+
+    # yields remaining origins in order of x then y
+    def __iter__(self):
+        bits = self.bits
+        rows = self.rows
+        # walk the mask a byte at a time so large domains iterate in linear time
+        data = bits.to_bytes((bits.bit_length() + 7) // 8, "little")
+        for byte_index, byte in enumerate(data):
+            base = byte_index * 8
+            while byte:
+                low = byte & -byte
+                yield divmod(base + low.bit_length() - 1, rows)
+                byte ^= low
+
+    def __repr__(self):
+        return "PlacementDomain(" + repr(list(self)) + ")"
+
+    # new domain keeping only the origins whose bits are set in mask (AND)
+    def keep_mask(self, mask):
+        return PlacementDomain(self.columns, self.rows, self.bits & mask)
+
+    # new domain without the origins whose bits are set in mask (ANDNOT)
+    def remove_mask(self, mask):
+        return PlacementDomain(self.columns, self.rows, self.bits & ~mask)
+
+    # new domain without the given origins
+    def without(self, domain_values):
+        return self.remove_mask(self.mask_of(domain_values))
+
+    # new domain with the given origins added, which must be inside the grid
+    def with_values(self, domain_values):
+        for value in domain_values:
+            if self.index_of(value) is None:
+                raise ValueError(repr(value) + " is outside the " + str(self.columns) + "x" + str(self.rows) + " grid of origins")
+        return PlacementDomain(self.columns, self.rows, self.bits | self.mask_of(domain_values))
+
+    # new domain containing just the given origin
+    def only(self, value):
+        return self.keep_mask(self.mask_of((value,)))
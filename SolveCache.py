@@ -0,0 +1,113 @@
+# Author: Annabel Revers
+# Date:   October 2021
+
+import hashlib
+import shelve
+import time
+from collections import OrderedDict
+
+class SolveCache:
+
+    # cache of search results for problems that are identical or the same up to renaming their variables
+        # results are keyed by a digest of problem.fingerprint() and stored as values in fingerprint order,
+        # so a hit is remapped to the caller's variables and checked with is_solution before it is returned
+        # keeps the max_size most recently used results in memory, and forgets results older than max_age seconds
+        # with a path, results are also kept in a shelve file there, which outlives the process
+    def __init__(self, max_size=1024, max_age=None, path=None):
+        self.max_size = max_size
+        self.max_age = max_age
+        self.entries = OrderedDict()  # digest -> (time stored, values in fingerprint order or False), least recently used first
+        self.shelf = shelve.open(path) if path is not None else None
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    # returns problem's solution, from the cache when a matching problem was solved before
+        # returns False when there is no solution, like backtracking_search
+    def solve(self, problem, mrv_on=True, deg_on=True, lcv_on=False, ac3_on=True):
+        fingerprint = problem.fingerprint()
+        if fingerprint is None:   # problem cannot be canonicalized, so always search
+            return problem.backtracking_search(mrv_on, deg_on, lcv_on, ac3_on)
+
+        key, order = fingerprint
+        digest = hashlib.sha256(repr(key).encode("utf-8")).hexdigest()
+        answer = self.lookup(problem, digest, order)
+        if answer is not None:
+            self.hits += 1
+            return answer
+
+        self.misses += 1
+        solution = problem.backtracking_search(mrv_on, deg_on, lcv_on, ac3_on)
+        # a search stopped by should_stop has not shown there is no solution
+        if solution or not problem.interrupted:
+            self.store(digest, order, solution)
+        return solution
+
+    # returns the cached answer for a digest remapped to problem's variables, or None on a miss
+    def lookup(self, problem, digest, order):
+        entry = self.get(digest)
+        if entry is None:
+            return None
+        if entry[1] is False:
+            return False
+
+        solution = problem.remap_solution(entry[1], order)
+        # a stored solution that does not fit this problem, e.g. one whose domains were edited, is a miss
+        if not problem.is_solution(solution):
+            return None
+        return solution
+
+    # returns the fresh (time stored, values) entry for a digest from memory or the shelve file, or None
+    def get(self, digest):
+        entry = self.entries.get(digest)
+        if entry is None and self.shelf is not None:
+            entry = self.shelf.get(digest)
+            if entry is not None:
+                self.remember(digest, entry)
+        if entry is None:
+            return None
+
+        if self.max_age is not None and time.time() - entry[0] > self.max_age:
+            self.forget(digest)
+            return None
+        self.entries.move_to_end(digest)
+        return entry
+
+    # stores a solution, or False for no solution, as values in fingerprint order
+    def store(self, digest, order, solution):
+        values = False
+        if solution:
+            values = []
+            for var in order:
+                values.append(solution[var])
+        entry = (time.time(), values)
+        self.remember(digest, entry)
+        if self.shelf is not None:
+            self.shelf[digest] = entry
+
+    # adds an entry to memory, evicting the least recently used entry when over max_size
+    def remember(self, digest, entry):
+        self.entries[digest] = entry
+        self.entries.move_to_end(digest)
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    # removes an entry from memory and the shelve file
+    def forget(self, digest):
+        self.entries.pop(digest, None)
+        if self.shelf is not None and digest in self.shelf:
+            del self.shelf[digest]
+
+    # removes every entry
+    def clear(self):
+        self.entries.clear()
+        if self.shelf is not None:
+            self.shelf.clear()
+
+    # closes the shelve file
+    def close(self):
+        if self.shelf is not None:
+            self.shelf.close()
+            self.shelf = None
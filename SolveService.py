@@ -0,0 +1,196 @@
+# Author: Annabel Revers
+# Date:   October 2021
+
+import asyncio
+import json
+import multiprocessing
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+
+from CircuitBoardProblem import CircuitBoardProblem
+from MapProblem import MapProblem
+from SolverStats import SolverStats
+
+# seconds a request may run past its timeout before it is answered without waiting for its worker
+TIMEOUT_GRACE = 1.0
+
+# shared array of cancel flags handed to each worker process by its pool initializer, one per request slot
+service_cancel_flags = None
+
+# runs in each new worker process to receive the cancel flags
+def init_service_worker(cancel_flags):
+    global service_cancel_flags
+    service_cancel_flags = cancel_flags
+
+# runs one request in a worker process, stopping when its slot's cancel flag is set,
+    # after time_limit seconds, or after node_limit nodes
+    # returns a result dictionary with the status, the solution (or None), the search's stats and its seconds
+def run_service_request(problem, config, slot, time_limit, node_limit):
+    start = perf_counter()
+    deadline = None if time_limit is None else start + time_limit
+    stats = SolverStats()
+    problem.stats = stats
+    reason = [None]
+
+    # checked once per search step
+    def should_stop():
+        if service_cancel_flags[slot]:
+            reason[0] = "cancelled"
+        elif node_limit is not None and stats.nodes >= node_limit:
+            reason[0] = "node_limit"
+        elif deadline is not None and perf_counter() > deadline:
+            reason[0] = "timeout"
+        return reason[0] is not None
+    problem.should_stop = should_stop
+
+    solution = problem.backtracking_search(*config)
+    if solution:
+        status = "solved"
+    elif problem.interrupted:
+        status = reason[0]
+    else:
+        status = "unsatisfiable"
+    return {"status": status, "solution": solution or None, "stats": stats.as_dict(), "seconds": perf_counter() - start}
+
+class SolveService:
+
+    # asyncio front end that runs searches in a pool of worker processes, kept alive and reused between requests
+        # at most max_pending requests are sent to the pool at once, later ones wait in solve_async for a free slot
+        # each running request has a slot with a cancel flag its worker's search checks at every step
+    def __init__(self, workers=None, max_pending=None):
+        self.workers = workers or multiprocessing.cpu_count()
+        self.max_pending = max_pending or self.workers
+        self.cancel_flags = multiprocessing.Array("b", self.max_pending, lock=False)
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=init_service_worker, initargs=(self.cancel_flags,))
+        self.free_slots = list(range(self.max_pending))
+        self.slots_available = asyncio.Semaphore(self.max_pending)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+    # solves problem in a worker process, returning a result dictionary with keys
+        # status: "solved", "unsatisfiable", "timeout", "node_limit" or "cancelled"
+        # solution: the solution found, or None
+        # stats: the search's SolverStats counters and timings as a dictionary, however far it got
+        # seconds: how long the search ran in its worker, or was waited for when it did not answer in time
+        # timeout and node_limit bound the search, the timeout counting from when solve_async is called
+        # cancelling the awaiting task sets the request's cancel flag, which stops its search at its next step
+    async def solve_async(self, problem, timeout=None, node_limit=None, config=(True, True, False, True)):
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+
+        # wait for a slot, which is back-pressure on callers when every slot is busy
+        if deadline is None:
+            await self.slots_available.acquire()
+        else:
+            try:
+                await asyncio.wait_for(self.slots_available.acquire(), max(deadline - loop.time(), 0))
+            except asyncio.TimeoutError:
+                return {"status": "timeout", "solution": None, "stats": SolverStats().as_dict(), "seconds": 0.0}
+        slot = self.free_slots.pop()
+        self.cancel_flags[slot] = 0
+
+        time_limit = None if deadline is None else max(deadline - loop.time(), 0)
+        submitted = loop.time()
+        try:
+            future = asyncio.wrap_future(self.executor.submit(run_service_request, problem, config, slot, time_limit, node_limit))
+        except BaseException:
+            # nothing will run in the slot, e.g. the pool broke after a worker crashed, so hand it on now
+            self.release(slot)
+            raise
+        # the slot is only handed on once its worker has finished, even if the caller stopped waiting
+        future.add_done_callback(lambda done: self.release(slot))
+
+        try:
+            if deadline is None:
+                return await asyncio.shield(future)
+            # searches check the deadline themselves, this only covers a step that runs long, such as one ac3 pass
+            done, pending = await asyncio.wait({future}, timeout=max(deadline - loop.time(), 0) + TIMEOUT_GRACE)
+            if future in done:
+                return future.result()
+            self.cancel_flags[slot] = 1
+            return {"status": "timeout", "solution": None, "stats": SolverStats().as_dict(), "seconds": loop.time() - submitted}
+        except asyncio.CancelledError:
+            self.cancel_flags[slot] = 1
+            raise
+
+    # frees a request's slot once its worker has finished with it
+    def release(self, slot):
+        self.free_slots.append(slot)
+        self.slots_available.release()
+
+    # stops every running search and shuts the worker processes down
+    def close(self):
+        for slot in range(self.max_pending):
+            self.cancel_flags[slot] = 1
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+# builds a problem from a JSON request of the stdin client
+    # {"type": "map", "states": [...], "colors": [...], "borders": [[state1, state2], ...]} or
+    # {"type": "board", "pieces": [[width, height], ...], "width": w, "height": h}
+def problem_from_request(request):
+    if request["type"] == "map":
+        borders = []
+        for state1, state2 in request["borders"]:
+            borders.append((state1, state2))
+            borders.append((state2, state1))
+        return MapProblem(request["states"], request["colors"], borders)
+    pieces = []
+    for piece in request["pieces"]:
+        pieces.append(tuple(piece))
+    return CircuitBoardProblem(pieces, request["width"], request["height"])
+
+# converts a solution to JSON, coloring states by name or listing each piece's [x, y] origin
+def solution_to_json(problem, solution):
+    if solution is None:
+        return None
+    if isinstance(problem, MapProblem):
+        colors = {}
+        for var in solution:
+            colors[problem.states[var]] = problem.colors[solution[var]]
+        return colors
+    origins = []
+    for var in sorted(solution):
+        origins.append(list(solution[var]))
+    return origins
+
+# answers one request of the stdin client and writes its result as a line of JSON
+async def answer_request(service, request):
+    problem = problem_from_request(request)
+    try:
+        result = await service.solve_async(problem, request.get("timeout"), request.get("node_limit"))
+    except asyncio.CancelledError:
+        result = {"status": "cancelled", "solution": None}
+    result["id"] = request.get("id")
+    result["solution"] = solution_to_json(problem, result["solution"])
+    print(json.dumps(result), flush=True)
+
+# stand-in client reading one JSON request per line from stdin and writing one JSON result per line to stdout
+    # requests run concurrently and are answered as they finish, {"cancel": id} cancels a running request
+async def serve_stdin(workers=None):
+    loop = asyncio.get_running_loop()
+    tasks = {}
+    async with SolveService(workers) as service:
+        while True:
+            line = await loop.run_in_executor(None, sys.stdin.readline)
+            if not line:
+                break
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            if "cancel" in request:
+                if request["cancel"] in tasks:
+                    tasks[request["cancel"]].cancel()
+                continue
+            task = asyncio.create_task(answer_request(service, request))
+            tasks[request.get("id")] = task
+            task.add_done_callback(lambda done, id=request.get("id"): tasks.pop(id, None))
+        # answer whatever is still running before shutting down
+        await asyncio.gather(*tasks.values(), return_exceptions=True)
+
+if __name__ == "__main__":
+    asyncio.run(serve_stdin())
@@ -0,0 +1,45 @@
+# Author: Annabel Revers
+# Date:   October 2021
+
+class SolverStats:
+
+    # counters and phase timings for searches run while attached to a problem as problem.stats
+        # the optional hooks are called as the search runs:
+        # on_assign(var, value) after a value is assigned and survives ac3
+        # on_backtrack(var) when var runs out of values
+        # on_prune(var, values) when ac3 removes values from var's domain
+    def __init__(self, on_assign=None, on_backtrack=None, on_prune=None):
+        self.nodes = 0  # variables selected and expanded
+        self.backtracks = 0  # variables that ran out of values
+        self.consistency_checks = 0  # is_consistent calls made by the search
+        self.found_consistent_calls = 0  # found_consistent calls made by ac3
+        self.revisions = 0  # arcs revised by ac3
+        self.values_pruned = 0  # domain values removed by ac3
+        self.max_depth = 0  # most variables assigned at once by the search
+
+        # seconds spent in each phase of the search
+        self.selection_time = 0.0  # choosing the next variable
+        self.ordering_time = 0.0  # ordering its values
+        self.propagation_time = 0.0  # running ac3
+
+        self.on_assign = on_assign
+        self.on_backtrack = on_backtrack
+        self.on_prune = on_prune
+
+    # returns the counters and timings as a dictionary, e.g. for saving with json
+    def as_dict(self):
+        return {
+            "nodes": self.nodes,
+            "backtracks": self.backtracks,
+            "consistency_checks": self.consistency_checks,
+            "found_consistent_calls": self.found_consistent_calls,
+            "revisions": self.revisions,
+            "values_pruned": self.values_pruned,
+            "max_depth": self.max_depth,
+            "selection_time": self.selection_time,
+            "ordering_time": self.ordering_time,
+            "propagation_time": self.propagation_time,
+        }
+
+    def __repr__(self):
+        return "SolverStats(" + ", ".join(key + "=" + str(value) for key, value in self.as_dict().items()) + ")"
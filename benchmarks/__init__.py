@@ -0,0 +1,5 @@
+# Author: Annabel Revers
+# Date:   October 2021
+
+# seeded instance generators and a timing harness for the backtracking search
+    # run with: python -m benchmarks.run --help
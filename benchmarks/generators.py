@@ -0,0 +1,110 @@
+# Author: Annabel Revers
+# Date:   October 2021
+
+import math
+import random
+
+# generates a planar map: a grid of regions where each cell of four regions is split by one random diagonal
+    # returns (states, colors, map) ready to pass to MapProblem, with about n states
+def planar_map(n, num_colors=4, seed=0):
+    rng = random.Random(seed)
+    columns = max(1, int(math.sqrt(n)))
+    rows = max(1, n // columns)
+
+    states = []
+    for i in range(rows * columns):
+        states.append("r" + str(i))
+
+    borders = []
+    for row in range(rows):
+        for column in range(columns):
+            i = row * columns + column
+            if column + 1 < columns:   # region to the right
+                borders.append((i, i + 1))
+            if row + 1 < rows:  # region below
+                borders.append((i, i + columns))
+            if column + 1 < columns and row + 1 < rows:    # one diagonal of the cell keeps the map planar
+                if rng.random() < 0.5:
+                    borders.append((i, i + columns + 1))
+                else:
+                    borders.append((i + 1, i + columns))
+
+    return states, make_colors(num_colors), make_map(states, borders)
+
+# generates a random geometric map: n regions at random points, bordering every region within a radius
+    # the radius is chosen so each region has about avg_degree neighbors
+def geometric_map(n, avg_degree=6, num_colors=4, seed=0):
+    rng = random.Random(seed)
+    radius = math.sqrt(avg_degree / (math.pi * n))
+
+    # bucket points into radius-sized cells so only neighboring cells are compared
+    points = []
+    cells = {}
+    for i in range(n):
+        point = (rng.random(), rng.random())
+        points.append(point)
+        cell = (int(point[0] / radius), int(point[1] / radius))
+        cells.setdefault(cell, []).append(i)
+
+    borders = []
+    for i in range(n):
+        x, y = points[i]
+        cell_x, cell_y = int(x / radius), int(y / radius)
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                for j in cells.get((cell_x + dx, cell_y + dy), ()):
+                    if j > i and (points[j][0] - x) ** 2 + (points[j][1] - y) ** 2 <= radius * radius:
+                        borders.append((i, j))
+
+    states = []
+    for i in range(n):
+        states.append("g" + str(i))
+    return states, make_colors(num_colors), make_map(states, borders)
+
+# generates a satisfiable circuit board: the board is cut into rectangles, then a fraction of them is kept
+    # density is the fraction of the board's area covered by the kept pieces, returned as (pieces, width, height)
+def packing_board(width, height, density=0.8, max_side=4, seed=0):
+    rng = random.Random(seed)
+
+    # guillotine cut the board until every rectangle fits within max_side
+    pieces = []
+    to_cut = [(width, height)]
+    while to_cut:
+        w, h = to_cut.pop()
+        if w <= max_side and h <= max_side:
+            pieces.append((w, h))
+        elif w >= h:
+            cut = rng.randint(1, w - 1)
+            to_cut.append((cut, h))
+            to_cut.append((w - cut, h))
+        else:
+            cut = rng.randint(1, h - 1)
+            to_cut.append((w, cut))
+            to_cut.append((w, h - cut))
+
+    # keep pieces in random order until they cover the requested area
+    rng.shuffle(pieces)
+    kept = []
+    area = 0
+    for piece in pieces:
+        if area >= density * width * height:
+            break
+        kept.append(piece)
+        area += piece[0] * piece[1]
+
+    return kept, width, height
+
+# names for num_colors colors
+def make_colors(num_colors):
+    colors = []
+    for i in range(num_colors):
+        colors.append("c" + str(i))
+    return colors
+
+# converts undirected borders between state indices into the directed name pairs MapProblem expects
+def make_map(states, borders):
+    constraints = []
+    for i, j in borders:
+        constraints.append((states[i], states[j]))
+        constraints.append((states[j], states[i]))
+    return constraints
@@ -0,0 +1,163 @@
+# Author: Annabel Revers
+# Date:   October 2021
+
+import argparse
+import json
+import tracemalloc
+from time import perf_counter
+
+from CircuitBoardProblem import CircuitBoardProblem
+from MapProblem import MapProblem
+from SolverStats import SolverStats
+from benchmarks.generators import geometric_map, packing_board, planar_map
+
+# benchmark cases for each suite, as (name, function building a fresh problem)
+SUITES = {
+    "small": [
+        ("planar-1k", lambda: MapProblem(*planar_map(1000, seed=1))),
+        ("geometric-1k", lambda: MapProblem(*geometric_map(1000, seed=1))),
+        ("board-10x10", lambda: CircuitBoardProblem(*packing_board(10, 10, 0.8, seed=1))),
+        ("board-20x20", lambda: CircuitBoardProblem(*packing_board(20, 20, 0.7, seed=1))),
+    ],
+    "medium": [
+        ("planar-10k", lambda: MapProblem(*planar_map(10000, seed=1))),
+        ("geometric-10k", lambda: MapProblem(*geometric_map(10000, seed=1))),
+        ("board-40x40", lambda: CircuitBoardProblem(*packing_board(40, 40, 0.8, seed=1))),
+        ("board-60x60", lambda: CircuitBoardProblem(*packing_board(60, 60, 0.9, seed=1))),
+    ],
+    "large": [
+        ("planar-100k", lambda: MapProblem(*planar_map(100000, seed=1))),
+        ("geometric-100k", lambda: MapProblem(*geometric_map(100000, seed=1))),
+        ("planar-1m", lambda: MapProblem(*planar_map(1000000, seed=1))),
+        ("board-100x100", lambda: CircuitBoardProblem(*packing_board(100, 100, 0.8, seed=1))),
+        ("board-200x200", lambda: CircuitBoardProblem(*packing_board(200, 200, 0.9, seed=1))),
+    ],
+}
+
+# every (mrv_on, deg_on, lcv_on, ac3_on) combination of backtracking_search
+CONFIGS = []
+for i in range(16):
+    CONFIGS.append((i & 8 != 0, i & 4 != 0, i & 2 != 0, i & 1 != 0))
+
+# short name for a heuristic configuration, e.g. "mrv+deg+ac3" or "none"
+def config_name(config):
+    names = []
+    for name, on in zip(("mrv", "deg", "lcv", "ac3"), config):
+        if on:
+            names.append(name)
+    return "+".join(names) or "none"
+
+# runs one search on problem, stopping after time_limit seconds or node_limit nodes
+    # returns "solved", "unsatisfiable" or "stopped", along with the search's stats
+def run_search(problem, config, time_limit=None, node_limit=None):
+    stats = SolverStats()
+    problem.stats = stats
+    deadline = None if time_limit is None else perf_counter() + time_limit
+
+    # checked once per search step
+    def should_stop():
+        if node_limit is not None and stats.nodes >= node_limit:
+            return True
+        return deadline is not None and perf_counter() > deadline
+    problem.should_stop = should_stop
+
+    solution = problem.backtracking_search(*config)
+    problem.stats = None
+    problem.should_stop = None
+
+    if solution:
+        return "solved", stats
+    elif problem.interrupted:
+        return "stopped", stats
+    return "unsatisfiable", stats
+
+# times every heuristic configuration on every case in a suite, returning a list of result dictionaries
+def run_suite(cases, configs, time_limit, memory_on):
+    results = []
+    for name, make_problem in cases:
+        start = perf_counter()
+        problem = make_problem()
+        build_seconds = perf_counter() - start
+
+        for config in configs:
+            start = perf_counter()
+            status, stats = run_search(problem, config, time_limit=time_limit)
+            seconds = perf_counter() - start
+
+            result = {
+                "case": name,
+                "config": config_name(config),
+                "status": status,
+                "build_seconds": build_seconds,
+                "seconds": seconds,
+                "nodes": stats.nodes,
+                "nodes_per_second": stats.nodes / seconds if seconds > 0 else 0.0,
+                "stats": stats.as_dict(),
+            }
+
+            # repeat the same amount of search with allocations traced, which would skew the timing above
+            if memory_on:
+                tracemalloc.start()
+                run_search(problem, config, node_limit=stats.nodes)
+                result["peak_memory"] = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+
+            results.append(result)
+            print(format_result(result), flush=True)
+    return results
+
+# one line summary of a result
+def format_result(result):
+    line = "{:<16} {:<16} {:<14} {:>9.3f}s {:>9} nodes {:>11.0f} nodes/s".format(
+        result["case"], result["config"], result["status"], result["seconds"], result["nodes"], result["nodes_per_second"])
+    if "peak_memory" in result:
+        line += " {:>9.1f} KiB".format(result["peak_memory"] / 1024)
+    return line
+
+# prints how each result changed from a saved baseline with the same case and configuration
+def compare(results, baseline):
+    old_results = {}
+    for result in baseline["results"]:
+        old_results[(result["case"], result["config"])] = result
+
+    print("----------------------------------------------")
+    print("Comparison with baseline (new/old seconds, status changes marked with *)")
+    print("----------------------------------------------")
+    for result in results:
+        old = old_results.get((result["case"], result["config"]))
+        if old is None:
+            continue
+        ratio = result["seconds"] / old["seconds"] if old["seconds"] > 0 else float("inf")
+        changed = "*" if old["status"] != result["status"] else " "
+        print("{:<16} {:<16} {:>9.3f}s -> {:>9.3f}s  x{:<7.2f} {}{} -> {}".format(
+            result["case"], result["config"], old["seconds"], result["seconds"], ratio, changed, old["status"], result["status"]))
+
+def main():
+    parser = argparse.ArgumentParser(description="Time every backtracking_search heuristic configuration on generated instances.")
+    parser.add_argument("--suite", choices=sorted(SUITES), default="small", help="which set of instances to run")
+    parser.add_argument("--case", action="append", help="only run cases with this name (repeatable)")
+    parser.add_argument("--config", action="append", help="only run configurations with this name, e.g. mrv+deg (repeatable)")
+    parser.add_argument("--time-limit", type=float, default=10.0, help="seconds allowed per search")
+    parser.add_argument("--no-memory", action="store_true", help="skip the traced run that measures peak memory")
+    parser.add_argument("--output", help="save results as JSON to this file")
+    parser.add_argument("--compare", help="JSON results from an earlier run to compare against")
+    args = parser.parse_args()
+
+    cases = SUITES[args.suite]
+    if args.case:
+        cases = [case for case in cases if case[0] in args.case]
+    configs = CONFIGS
+    if args.config:
+        configs = [config for config in CONFIGS if config_name(config) in args.config]
+
+    results = run_suite(cases, configs, args.time_limit, not args.no_memory)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"suite": args.suite, "time_limit": args.time_limit, "results": results}, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+if __name__ == "__main__":
+    main()